@@ -1,14 +1,28 @@
-from flask import Flask, request, make_response, session
+from flask import Flask, request, session, send_file, jsonify
 import pandas as pd
-import plotly.express as px
-import plotly.io as pio
 import os
 import logging
 from datetime import datetime
-import openpyxl
+import numpy as np
 import re
 import string
 import secrets
+import hashlib
+import json
+import time
+import threading
+import functools
+import importlib.util
+import sys
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from pricingdeconstructor import engine
+from pricingdeconstructor.engine import (
+    PricingError, RowDeduplicator, compile_pricing_rules, cost_component_columns, deduplicate_results, load_sales_report,
+    parse_pricing_file, parse_pricing_rules, parse_sales_report, price_sales_data, process_step_mapping,
+    reprice_results, result_columns, run_batch, sales_file_extensions, write_results_file
+)
+from pricingdeconstructor.rule_store import compiled_rule_set, list_rule_sets, load_rule_set, resolve_rules, save_rule_set
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)  # Generate a secure random secret key
@@ -17,27 +31,40 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # Prevent CSRF
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # Session persists for 1 hour
 UPLOAD_FOLDER = 'Uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')  # Uploaded reports, stored once per content hash
+os.makedirs(BLOB_FOLDER, exist_ok=True)
+CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'cache')
+os.makedirs(CACHE_FOLDER, exist_ok=True)
+app.config['PARSED_CACHE_MAX_BYTES'] = 512 * 1024 * 1024  # Disk budget for parsed uploads
+app.config['PARSED_CACHE_TTL'] = 24 * 3600  # Parsed uploads expire after a day
+DATASET_FOLDER = os.path.join(UPLOAD_FOLDER, 'datasets')
+os.makedirs(DATASET_FOLDER, exist_ok=True)
+app.config['DATASET_RETENTION'] = 7 * 24 * 3600  # Uploaded reports are kept for a week after last use
+RESULTS_FOLDER = os.path.join(UPLOAD_FOLDER, 'results')
+os.makedirs(RESULTS_FOLDER, exist_ok=True)
+METRICS_FOLDER = os.path.join(UPLOAD_FOLDER, 'metrics')  # Stage metrics, one file per process
+os.makedirs(METRICS_FOLDER, exist_ok=True)
+app.config['METRICS_RETENTION'] = 7 * 24 * 3600  # Metrics of exited processes are dropped a week after their last stage
+app.config['RESULT_RETENTION'] = 24 * 3600  # Result downloads are kept for a day
+app.config.update(engine.config)  # Parsing, export and batch settings shared with the command line tool
+engine.config = app.config  # The engine reads them back from here, so overrides in app.config apply
+app.config['RESULTS_PAGE_SIZE'] = 100  # Rows per page of the results table
+app.config['RESULTS_MAX_PAGE_SIZE'] = 500  # Upper bound on the limit a client may request
+app.config['CHART_TOP_CUSTOMERS'] = 50  # Customers drawn in the Lowest Base Cost chart
+app.config['CHART_BINS'] = 30  # Histogram bins for the lowest Base Cost of every customer
+app.config['INCREMENTAL_REPRICING'] = True  # Re-price a dataset's previous results in place when only the rules change
+app.config['JOB_WORKERS'] = 2  # Processes for background pricing jobs in each web worker
+app.config['REDIS_URL'] = os.environ.get('REDIS_URL')  # When set, background jobs go to Redis for `python app.py worker`
+app.config['JOB_QUEUE_KEY'] = 'pricingdeconstructor:jobs'
+app.config['RULES_DB'] = os.environ.get('RULES_DB', os.path.join(UPLOAD_FOLDER, 'rules.sqlite3'))  # Saved rule sets
+
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()  # DEBUG, INFO, WARNING or ERROR
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=app.config['LOG_LEVEL'], format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-
-# Store pricing rules in memory
-pricing_rules = {
-    "Process": {},
-    "Coating": {},
-    "Foil Material": {},
-    "Foil Thickness": {},
-    "Colour": {}
-}
-
-# Process and Step Process coupling
-process_step_mapping = {
-    "Chemetch": ["Single", "Double", "Triple", "5 or more"],
-    "LaserSTEP": ["1-2", "1-5", "1-10", "1-15", "1-20", "21-30", "31-40", "41-50", "51-60"],
-    "Milled": ["Single", "Double", "Triple", "Quad"],
-    "LaserCut": []
-}
+if app.config['TRACE_ROWS'] > 0:
+    engine.trace_logger.setLevel(logging.INFO)  # Asking for a trace shows it at any log level
 
 # Inline CSS
 css = """
@@ -47,7 +74,7 @@ css = """
     h1 { color: #333; text-align: center; }
     .form-group { margin-bottom: 15px; }
     label { display: inline-block; width: 200px; font-weight: bold; }
-    input[type="file"], input[type="number"] { padding: 5px; width: 200px; }
+    input[type="file"], input[type="number"], input[type="text"], select { padding: 5px; width: 200px; }
     button { padding: 10px 20px; background-color: #007bff; color: white; border: none; cursor: pointer; }
     button:hover { background-color: #0056b3; }
     table { width: 100%; border-collapse: collapse; margin-top: 20px; }
@@ -60,7 +87,12 @@ css = """
     .download:hover { background-color: #218838; }
     .download-excel { background-color: #17a2b8; }
     .download-excel:hover { background-color: #138496; }
-    #chart { margin-top: 20px; }
+    #chart, #chart-bins { margin-top: 20px; }
+    .filters { margin-top: 20px; }
+    .filters input, .filters select { padding: 5px; margin-right: 10px; }
+    th.sortable { cursor: pointer; }
+    .pager { margin-top: 10px; text-align: center; }
+    .pager button { margin: 0 10px; }
 </style>
 """
 
@@ -77,8 +109,8 @@ upload_html = """
         {{error|safe}}
         <form method="post" enctype="multipart/form-data">
             <div class="form-group">
-                <label for="file">Select Excel File (.xlsx):</label>
-                <input type="file" id="file" name="file" accept=".xlsx">
+                <label for="file">Select Sales Report (.xlsx, .csv, .parquet, .feather):</label>
+                <input type="file" id="file" name="file" accept=".xlsx,.csv,.parquet,.feather">
             </div>
             <button type="submit">Upload & Proceed to Pricing</button>
         </form>
@@ -100,10 +132,20 @@ pricing_form_html = """
         <h1>Enter Pricing Rules</h1>
         {{error|safe}}
         <form method="post" action="/pricing" enctype="multipart/form-data">
+            <input type="hidden" name="dataset_id" value="{{dataset_id or ''}}">
             <div class="form-group">
                 <label for="pricing_file">Import Pricing File (.txt):</label>
                 <input type="file" id="pricing_file" name="pricing_file" accept=".txt">
             </div>
+            <div class="form-group">
+                <label for="saved_rules">Use Saved Rule Set:</label>
+                <select id="saved_rules" name="saved_rules">
+                    <option value="">(use the prices below)</option>
+                    {% for saved in saved_rule_sets() %}
+                    <option value="{{saved.id}}">{{saved.name}} v{{saved.version}}</option>
+                    {% endfor %}
+                </select>
+            </div>
             <h3>Process and Step Process</h3>
             {% for process in processes %}
             <div class="form-group">
@@ -123,6 +165,14 @@ pricing_form_html = """
                 <input type="number" step="0.01" id="Coating_{{coating}}" name="Coating_{{coating}}" placeholder="Cost ($)" value="{{form_data.get('Coating_' ~ coating, '')}}">
             </div>
             {% endfor %}
+            <div class="form-group">
+                <label for="rule_set_name">Save Prices As</label>
+                <input type="text" id="rule_set_name" name="rule_set_name" placeholder="e.g. Q3 prices" value="{{form_data.get('rule_set_name', '')}}">
+            </div>
+            <div class="form-group">
+                <label for="background">Run in Background</label>
+                <input type="checkbox" id="background" name="background" value="1">
+            </div>
             <button type="submit">Process File</button>
         </form>
         <p><a href="/debug">View Debug Info</a></p>
@@ -138,55 +188,149 @@ results_html = """
 <head>
     <title>Results</title>
 """ + css + """
-    <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
+    <script src="/assets/plotly-{{plotly_version}}.min.js"></script>
 </head>
 <body>
     <div class="container">
         <h1>Deconstructed Pricing</h1>
-        <p>{{data|length}} Unique Customer-Material-Price Combinations Processed</p>
+        <p>{{row_count}} Unique Customer-Material-Price Combinations Processed</p>
         {{error|safe}}
-        <a href="/download" class="download">Download Results as CSV</a>
-        <a href="/download_excel" class="download download-excel">Download Results as Excel</a>
+        <a href="/download?job_id={{job_id}}" class="download">Download Results as CSV</a>
+        <a href="/download_excel?job_id={{job_id}}" class="download download-excel">Download Results as Excel</a>
+        <a href="/pricing?dataset_id={{dataset_id}}" class="download">Re-price This Report</a>
         <h3>Lowest Base Cost by Customer</h3>
-        <div id="chart">{{chart|safe}}</div>
+        <div id="chart"></div>
+        <div id="chart-bins"></div>
+        <div class="filters">
+            <input type="text" id="filter-customer" placeholder="Filter Customer">
+            <select id="filter-process"><option value="">All Processes</option></select>
+            <select id="filter-coating"><option value="">All Coatings</option></select>
+        </div>
         <table>
             <thead>
                 <tr>
-                    <th>Customer</th>
-                    <th>Customer Internal ID</th>
-                    <th>Frame</th>
-                    <th>Item Internal ID</th>
-                    <th>Sales Price</th>
-                    <th>Process</th>
-                    <th>Step Process</th>
-                    <th>Coating</th>
-                    <th>Foil Material</th>
-                    <th>Foil Thickness</th>
-                    <th>Colour</th>
-                    <th>Attribute Cost</th>
-                    <th>Base Cost</th>
+                    {% for column, label in columns %}
+                    <th class="sortable" data-column="{{column}}">{{label}}</th>
+                    {% endfor %}
                 </tr>
             </thead>
-            <tbody>
-                {% for row in data %}
-                <tr>
-                    <td>{{row.Customer}}</td>
-                    <td>{{row.Customer_Internal_ID}}</td>
-                    <td>{{row.Frame}}</td>
-                    <td>{{row.Item_Internal_ID}}</td>
-                    <td>{{row.Sales_Price}}</td>
-                    <td>{{row.Process}}</td>
-                    <td>{{row.Step_Process}}</td>
-                    <td>{{row.Coating}}</td>
-                    <td>{{row.Foil_Material}}</td>
-                    <td>{{row.Foil_Thickness}}</td>
-                    <td>{{row.Colour}}</td>
-                    <td>{{row.Attribute_Cost}}</td>
-                    <td>{{row.Base_Cost}}</td>
-                </tr>
-                {% endfor %}
-            </tbody>
+            <tbody id="results-body"></tbody>
         </table>
+        <div class="pager">
+            <button type="button" id="prev-page">Previous</button>
+            <span id="page-info"></span>
+            <button type="button" id="next-page">Next</button>
+        </div>
+        <script>
+            // Rows are fetched one page at a time from the stored result set
+            const state = {offset: 0, limit: {{page_size}}, sort: '', order: 'asc', total: 0, optionsLoaded: false};
+            const columns = {{columns|map('first')|list|tojson}};
+            function cell(value) {
+                const td = document.createElement('td');
+                td.textContent = value === null ? '' : value;
+                return td;
+            }
+            function fillOptions(id, values) {
+                const select = document.getElementById(id);
+                values.forEach(function(value) {
+                    const option = document.createElement('option');
+                    option.value = value;
+                    option.textContent = value;
+                    select.appendChild(option);
+                });
+            }
+            function loadPage() {
+                const params = new URLSearchParams({
+                    job_id: '{{job_id}}', offset: state.offset, limit: state.limit, sort: state.sort, order: state.order,
+                    customer: document.getElementById('filter-customer').value,
+                    process: document.getElementById('filter-process').value,
+                    coating: document.getElementById('filter-coating').value
+                });
+                fetch('/results/data?' + params).then(function(response) { return response.json(); }).then(function(page) {
+                    const body = document.getElementById('results-body');
+                    body.innerHTML = '';
+                    page.rows.forEach(function(row) {
+                        const tr = document.createElement('tr');
+                        columns.forEach(function(column) { tr.appendChild(cell(row[column])); });
+                        body.appendChild(tr);
+                    });
+                    state.total = page.total;
+                    const last = Math.min(page.offset + page.rows.length, page.total);
+                    document.getElementById('page-info').textContent = (page.total ? page.offset + 1 : 0) + '-' + last + ' of ' + page.total;
+                    if (!state.optionsLoaded) {
+                        fillOptions('filter-process', page.options.Process);
+                        fillOptions('filter-coating', page.options.Coating);
+                        state.optionsLoaded = true;
+                    }
+                });
+            }
+            function reload() { state.offset = 0; loadPage(); }
+            document.getElementById('prev-page').onclick = function() { state.offset = Math.max(0, state.offset - state.limit); loadPage(); };
+            document.getElementById('next-page').onclick = function() { if (state.offset + state.limit < state.total) { state.offset += state.limit; loadPage(); } };
+            document.getElementById('filter-customer').oninput = reload;
+            document.getElementById('filter-process').onchange = reload;
+            document.getElementById('filter-coating').onchange = reload;
+            document.querySelectorAll('th.sortable').forEach(function(th) {
+                th.onclick = function() {
+                    state.order = state.sort === th.dataset.column && state.order === 'asc' ? 'desc' : 'asc';
+                    state.sort = th.dataset.column;
+                    reload();
+                };
+            });
+            loadPage();
+            // The chart is drawn from aggregated data: the lowest-cost customers, plus a histogram when there are more
+            fetch('/results/chart?job_id={{job_id}}').then(function(response) { return response.json(); }).then(function(chart) {
+                if (chart.error) {
+                    document.getElementById('chart').innerHTML = '<p class="error"></p>';
+                    document.querySelector('#chart .error').textContent = chart.error;
+                    return;
+                }
+                const shown = chart.top.Customer.length;
+                const title = 'Lowest Base Cost by Customer' + (shown < chart.customers ? ' (' + shown + ' lowest of ' + chart.customers + ' customers)' : '');
+                Plotly.newPlot('chart', [{type: 'bar', x: chart.top.Customer, y: chart.top.Base_Cost}],
+                    {title: {text: title}, xaxis: {title: {text: 'Customer'}, tickangle: 45}, yaxis: {title: {text: 'Base Cost ($)'}}},
+                    {responsive: true});
+                if (shown < chart.customers) {
+                    const edges = chart.bins.edges;
+                    const centers = chart.bins.counts.map(function(_, i) { return (edges[i] + edges[i + 1]) / 2; });
+                    Plotly.newPlot('chart-bins', [{type: 'bar', x: centers, y: chart.bins.counts, width: edges[1] - edges[0]}],
+                        {title: {text: 'Customers by Lowest Base Cost'}, xaxis: {title: {text: 'Lowest Base Cost ($)'}}, yaxis: {title: {text: 'Customers'}}},
+                        {responsive: true});
+                }
+            });
+        </script>
+        <p><a href="/debug">View Debug Info</a></p>
+    </div>
+</body>
+</html>
+"""
+
+# Background job page HTML
+job_html = """
+<!DOCTYPE html>
+<html>
+<head><title>Processing</title>
+""" + css + """
+</head>
+<body>
+    <div class="container">
+        <h1>Processing Sales Report</h1>
+        <p class="debug">Job ID: {{job_id}}</p>
+        <p id="job-status">Queued</p>
+        <script>
+            // Poll the job until it finishes, then show its results
+            function poll() {
+                fetch('/jobs/{{job_id}}').then(function(response) { return response.json(); }).then(function(status) {
+                    if (status.state === 'done' || status.state === 'failed') {
+                        window.location = '/jobs/{{job_id}}/results';
+                        return;
+                    }
+                    document.getElementById('job-status').textContent = (status.stage || status.state) + ' (' + (status.progress || 0) + '%)';
+                    setTimeout(poll, 1000);
+                });
+            }
+            poll();
+        </script>
         <p><a href="/debug">View Debug Info</a></p>
     </div>
 </body>
@@ -211,6 +355,18 @@ debug_html = """
         <p class="debug">Column Names: {{column_names}}</p>
         <p class="debug">Form Data: {{form_data}}</p>
         <p class="debug">Session Data: {{session_data}}</p>
+        {% for title, stages in stage_tables if stages %}
+        <h2>{{title}}</h2>
+        <table>
+            <tr><th>Stage</th><th>Seconds</th><th>Rows In</th><th>Rows Out</th><th>Process Peak Memory (MB)</th></tr>
+            {% for stage in stages %}
+            <tr><td>{{stage.stage}}</td><td>{{'%.3f' % stage.seconds}}</td><td>{{stage.rows_in if stage.rows_in is not none else ''}}</td>
+                <td>{{stage.rows_out if stage.rows_out is not none else ''}}</td>
+                <td>{{'%.1f' % (stage.peak_memory_bytes / 1048576) if stage.peak_memory_bytes else ''}}</td></tr>
+            {% endfor %}
+        </table>
+        {% endfor %}
+        <p class="debug">All runs: <a href="/metrics">/metrics</a></p>
         <p><a href="/">Back to Upload</a></p>
     </div>
 </body>
@@ -228,12 +384,11 @@ def debug_info():
     session_data = dict(session)  # Get all session data for debugging
     if file_exists:
         try:
-            wb = openpyxl.load_workbook(file_path)
-            sheet_names = ', '.join(wb.sheetnames)
+            workbook = validate_upload(file_path)
+            sheet_names = ', '.join(workbook['sheet_names'])
             logger.debug(f"Sheet names in {file_path}: {sheet_names}")
-            if 'SalesbyItemBASEPRICEDECON' in wb.sheetnames:
-                df = pd.read_excel(file_path, sheet_name='SalesbyItemBASEPRICEDECON', engine='openpyxl', nrows=1)
-                column_names = ', '.join(str(col) for col in df.columns)
+            if workbook['columns'] is not None:
+                column_names = ', '.join(str(col) for col in workbook['columns'])
                 logger.debug(f"Column names in {file_path}: {column_names}")
             else:
                 column_names = 'Sheet not found'
@@ -241,7 +396,14 @@ def debug_info():
             sheet_names = f'Error reading sheets: {str(e)}'
             column_names = 'N/A'
             logger.error(f"Error reading sheet names or columns: {str(e)}")
+    dataset = load_dataset(session.get('dataset_id'))
+    job_status = read_job_status(session.get('job_id'))
+    stage_tables = [
+        ('Upload Stages', dataset.get('upload_stages') if dataset else None),
+        ('Pricing Run Stages', job_status.get('stages') if job_status else None)
+    ]
     return app.jinja_env.from_string(debug_html).render(
+        stage_tables=stage_tables,
         timestamp=datetime.now().strftime('%Y%m%d_%H%M%S'),
         file_path=file_path,
         file_exists=file_exists,
@@ -259,6 +421,492 @@ def sanitize_filename(filename):
     sanitized = re.sub(r'_+', '_', sanitized)
     return sanitized.strip('_')
 
+result_column_labels = [(col, col.replace('_', ' ')) for col in result_columns]
+app.jinja_env.globals['saved_rule_sets'] = lambda: list_rule_sets(app.config['RULES_DB'])  # Offered on every pricing form
+
+def save_upload_blob(file):
+    """Stream an uploaded file into content-addressed storage, hashing it on the way.
+
+    Returns (file_path, content_hash, reused). Identical uploads share one file named
+    by their SHA-256; reused is True when that file was already stored.
+    """
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(BLOB_FOLDER, f"upload-{secrets.token_hex(8)}.tmp")
+    with open(tmp_path, 'wb') as f:
+        for block in iter(lambda: file.stream.read(1024 * 1024), b''):
+            digest.update(block)
+            f.write(block)
+    content_hash = digest.hexdigest()
+    # The extension is kept because CSV reports are recognized by it
+    file_path = os.path.join(BLOB_FOLDER, content_hash + os.path.splitext(file.filename)[1].lower())
+    if os.path.exists(file_path):
+        os.remove(tmp_path)
+        logger.debug(f"Upload {file.filename} is already stored as {file_path}")
+        return file_path, content_hash, True
+    os.replace(tmp_path, file_path)  # Concurrent identical uploads each rename the same bytes into place
+    return file_path, content_hash, False
+
+def validation_record_path(file_path):
+    """Return the path of the saved header check for a stored upload."""
+    return file_path + '.json'
+
+def validate_upload(file_path):
+    """Check a stored upload's format, sheet and columns, reusing the result saved beside it.
+
+    Returns load_sales_report's header check (format, sheet_names, columns,
+    missing_required, missing_optional) without its data. Stored uploads never change,
+    so a repeat upload of the same content is validated without opening it.
+    """
+    record_path = validation_record_path(file_path)
+    try:
+        with open(record_path, 'r') as f:
+            workbook = json.load(f)
+        logger.debug(f"Reusing validation of {file_path}")
+        return workbook
+    except (OSError, ValueError):
+        pass
+    workbook = load_sales_report(file_path)
+    del workbook['df']
+    workbook = json.loads(json.dumps(workbook, default=str))  # Headers may hold dates or numbers
+    try:
+        with open(record_path + '.tmp', 'w') as f:
+            json.dump(workbook, f)
+        os.replace(record_path + '.tmp', record_path)
+    except OSError as e:
+        logger.warning(f"Failed to save validation of {file_path}: {str(e)}")
+    return workbook
+
+def remove_upload_file(file_path):
+    """Delete a stored upload and its saved validation, unless a dataset still uses it."""
+    for name in os.listdir(DATASET_FOLDER):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(DATASET_FOLDER, name), 'r') as f:
+                if json.load(f)['file_path'] == file_path:
+                    logger.debug(f"Keeping {file_path}, still used by dataset {name[:-len('.json')]}")
+                    return
+        except (OSError, ValueError, KeyError):
+            continue
+    for path in (file_path, validation_record_path(file_path)):
+        try:
+            os.remove(path)
+            logger.debug(f"Removed upload file: {path}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to remove upload file {path}: {str(e)}")
+
+# Cached column holding how many report rows each row of a streamed report stands for
+cached_count_column = 'Row_Count'
+
+def parsed_cache_paths(content_hash):
+    """Return the (data, metadata) paths of a parsed-upload cache entry."""
+    base = os.path.join(CACHE_FOLDER, content_hash)
+    return base + '.parquet', base + '.json'
+
+def load_cached_sales_data(content_hash):
+    """Return cached (sales_df, skipped_rows, row_counts, rows_seen) for an upload hash, or None on a miss.
+
+    row_counts and rows_seen are the deduplicator state of a streamed report (None and
+    0 otherwise), whose cached rows are already deduplicated.
+    """
+    data_path, meta_path = parsed_cache_paths(content_hash)
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if time.time() - meta['created'] > app.config['PARSED_CACHE_TTL']:
+            logger.debug(f"Parsed cache entry expired: {content_hash}")
+            return None
+        rows_seen = meta['rows_seen']  # Entries written before counts were kept are missed and rebuilt
+        sales_df = pd.read_parquet(data_path)
+        os.utime(data_path)  # Mark as recently used for LRU eviction
+    except (OSError, ValueError, KeyError) as e:
+        logger.debug(f"Parsed cache miss for {content_hash}: {str(e)}")
+        return None
+    row_counts = sales_df.pop(cached_count_column).to_numpy() if rows_seen else None
+    logger.debug(f"Parsed cache hit for {content_hash}: {len(sales_df)} rows")
+    return sales_df, [tuple(row) for row in meta['skipped_rows']], row_counts, rows_seen
+
+def store_cached_sales_data(content_hash, sales_df, skipped_rows, deduplicator):
+    """Write parsed sales data (with a streamed report's duplicate counts) to the cache, then evict expired and least recently used entries."""
+    data_path, meta_path = parsed_cache_paths(content_hash)
+    try:
+        if deduplicator.rows_seen:
+            sales_df = sales_df.assign(**{cached_count_column: deduplicator.counts_for(sales_df)})
+        # Write to temporary names first so other workers never see a partial entry
+        sales_df.to_parquet(data_path + '.tmp', index=False)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'created': time.time(), 'rows': len(sales_df), 'skipped_rows': skipped_rows,
+                       'rows_seen': deduplicator.rows_seen}, f)
+        os.replace(data_path + '.tmp', data_path)
+        os.replace(meta_path + '.tmp', meta_path)
+        logger.debug(f"Stored parsed cache entry {content_hash}: {len(sales_df)} rows")
+    except Exception as e:
+        logger.warning(f"Failed to cache parsed data for {content_hash}: {str(e)}")
+    evict_parsed_cache()
+
+def evict_parsed_cache():
+    """Drop parsed-cache entries past their TTL, then the least recently used ones over the size budget."""
+    entries = []
+    for name in os.listdir(CACHE_FOLDER):
+        if not name.endswith('.parquet'):
+            continue
+        data_path, meta_path = parsed_cache_paths(name[:-len('.parquet')])
+        try:
+            last_used = os.path.getmtime(data_path)
+            size = os.path.getsize(data_path) + os.path.getsize(meta_path)
+            if time.time() - os.path.getmtime(meta_path) > app.config['PARSED_CACHE_TTL']:
+                last_used = 0  # Expired entries sort first and are always removed
+        except OSError:
+            last_used, size = 0, 0
+        entries.append((last_used, size, data_path, meta_path))
+    total = sum(size for _, size, _, _ in entries)
+    for last_used, size, data_path, meta_path in sorted(entries):
+        if last_used and total <= app.config['PARSED_CACHE_MAX_BYTES']:
+            break
+        for path in (data_path, meta_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+        logger.debug(f"Evicted parsed cache entry: {os.path.basename(data_path)}")
+
+def dataset_meta_path(dataset_id):
+    """Return the metadata path of a stored dataset."""
+    return os.path.join(DATASET_FOLDER, f"{dataset_id}.json")
+
+def save_dataset(dataset):
+    """Write dataset metadata atomically."""
+    meta_path = dataset_meta_path(dataset['id'])
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(dataset, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+def create_dataset(file_path, filename, content_hash, column_warning, upload_stages=None):
+    """Register a validated upload as a dataset that can be priced repeatedly."""
+    now = time.time()
+    dataset = {
+        'id': secrets.token_hex(8),
+        'filename': filename,
+        'file_path': file_path,
+        'content_hash': content_hash,
+        'column_warning': column_warning,
+        'created': now,
+        'last_used': now,
+        'upload_stages': upload_stages or []  # Stage timings of the upload request, shown on /debug
+    }
+    save_dataset(dataset)
+    logger.debug(f"Created dataset {dataset['id']} for {file_path}")
+    return dataset
+
+def load_dataset(dataset_id):
+    """Return a stored dataset's metadata, or None if it is unknown or past its retention."""
+    if not dataset_id or not re.fullmatch(r'[0-9a-f]{16}', dataset_id):
+        return None
+    try:
+        with open(dataset_meta_path(dataset_id), 'r') as f:
+            dataset = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.debug(f"Dataset {dataset_id} not found: {str(e)}")
+        return None
+    if time.time() - dataset['last_used'] > app.config['DATASET_RETENTION']:
+        logger.debug(f"Dataset {dataset_id} expired")
+        remove_dataset(dataset)
+        return None
+    return dataset
+
+def remove_dataset(dataset):
+    """Delete a dataset's metadata, and its uploaded file once no other dataset shares it."""
+    try:
+        os.remove(dataset_meta_path(dataset['id']))
+        logger.debug(f"Removed dataset {dataset['id']}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Failed to remove dataset {dataset['id']}: {str(e)}")
+    remove_upload_file(dataset['file_path'])
+
+def purge_expired_datasets():
+    """Remove datasets that have not been used within the retention period."""
+    for name in os.listdir(DATASET_FOLDER):
+        if name.endswith('.json'):
+            load_dataset(name[:-len('.json')])
+
+def create_result_job():
+    """Create a private results folder for one pricing run and return its job ID."""
+    job_id = secrets.token_hex(8)
+    os.makedirs(os.path.join(RESULTS_FOLDER, job_id))
+    return job_id
+
+def result_artifact_path(job_id, filename):
+    """Return the path of a result file for a job, or None if the job is unknown or expired."""
+    if not job_id or not re.fullmatch(r'[0-9a-f]{16}', job_id):
+        return None
+    job_folder = os.path.join(RESULTS_FOLDER, job_id)
+    try:
+        if time.time() - os.path.getmtime(job_folder) > app.config['RESULT_RETENTION']:
+            logger.debug(f"Result job {job_id} expired")
+            return None
+    except OSError:
+        return None
+    return os.path.join(job_folder, filename)
+
+def export_results(job_id, fmt):
+    """Return the path of a job's CSV or XLSX export, generating it from stored results on first request."""
+    export_path = result_artifact_path(job_id, f'results.{fmt}')
+    if not export_path or os.path.exists(export_path):
+        return export_path
+    data_path = result_artifact_path(job_id, 'results.parquet')
+    if not os.path.exists(data_path):
+        return None
+    with stage_timer(f'export_{fmt}') as stage:
+        result_df = pd.read_parquet(data_path)
+        stage['rows_in'] = stage['rows_out'] = len(result_df)
+        # Concurrent first downloads each write their own file, named with the extension pandas
+        # checks for xlsx; the last rename wins
+        tmp_path = result_artifact_path(job_id, f'results.{secrets.token_hex(4)}.tmp.{fmt}')
+        write_results_file(result_df, tmp_path, fmt)
+        os.replace(tmp_path, export_path)
+    record_job_stage(job_id, stage)
+    logger.debug(f"Generated {fmt} export for job {job_id}: {export_path}")
+    return export_path
+
+def build_chart_data(result_df):
+    """Aggregate results for the Lowest Base Cost by Customer chart.
+
+    Returns a JSON-ready dict: the number of customers, the CHART_TOP_CUSTOMERS with
+    the lowest Base Cost, and a CHART_BINS histogram of every customer's lowest Base Cost.
+    """
+    lowest = result_df.groupby('Customer', observed=True)['Base_Cost'].min().dropna().sort_values(kind='mergesort')
+    top = lowest.iloc[:app.config['CHART_TOP_CUSTOMERS']]
+    counts, edges = np.histogram(lowest.to_numpy(), bins=app.config['CHART_BINS']) if len(lowest) else ([], [])
+    return {
+        'customers': len(lowest),
+        'top': {'Customer': top.index.astype(str).tolist(), 'Base_Cost': top.round(2).tolist()},
+        'bins': {'counts': np.asarray(counts).tolist(), 'edges': np.round(edges, 2).tolist()},
+    }
+
+def store_chart_data(chart_path, chart):
+    """Write chart data beside a job's results; concurrent writers each use their own file and the last rename wins."""
+    tmp_path = f"{chart_path}.{secrets.token_hex(4)}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(chart, f)
+    os.replace(tmp_path, chart_path)
+
+def chart_data_path(job_id):
+    """Return the path of a job's chart data, aggregating it from stored results on first request."""
+    chart_path = result_artifact_path(job_id, 'chart.json')
+    if not chart_path or os.path.exists(chart_path):
+        return chart_path
+    result_df = load_result_frame(job_id)
+    if result_df is None:
+        return None
+    with stage_timer('chart', rows_in=len(result_df)) as stage:
+        chart = build_chart_data(result_df)
+        stage['rows_out'] = chart['customers']
+        store_chart_data(chart_path, chart)
+    record_job_stage(job_id, stage)
+    logger.debug(f"Generated chart data for job {job_id}: {chart_path}")
+    return chart_path
+
+@functools.lru_cache(maxsize=1)
+def plotly_bundle():
+    """Return (path, version) of the plotly.js bundle shipped in the pinned plotly package, without importing it."""
+    package_dir = importlib.util.find_spec('plotly').submodule_search_locations[0]
+    path = os.path.join(package_dir, 'package_data', 'plotly.min.js')
+    with open(path, 'r') as f:
+        version = re.search(r'plotly\.js v([\w.-]+)', f.read(200)).group(1)
+    return path, version
+
+@functools.lru_cache(maxsize=8)
+def read_result_frame(data_path, modified):
+    """Read a stored result set; cached per file version so paging does not re-read Parquet."""
+    return pd.read_parquet(data_path)
+
+def load_result_frame(job_id):
+    """Return a job's stored results as a DataFrame, or None if unavailable."""
+    data_path = result_artifact_path(job_id, 'results.parquet')
+    if not data_path or not os.path.exists(data_path):
+        return None
+    return read_result_frame(data_path, os.path.getmtime(data_path))
+
+def purge_expired_results():
+    """Remove result folders older than the result retention period."""
+    for job_id in os.listdir(RESULTS_FOLDER):
+        job_folder = os.path.join(RESULTS_FOLDER, job_id)
+        try:
+            if time.time() - os.path.getmtime(job_folder) <= app.config['RESULT_RETENTION']:
+                continue
+            for name in os.listdir(job_folder):
+                os.remove(os.path.join(job_folder, name))
+            os.rmdir(job_folder)
+            logger.debug(f"Removed expired result job: {job_id}")
+        except OSError as e:
+            logger.warning(f"Failed to remove result job {job_id}: {str(e)}")
+
+# Histogram bucket upper bounds for stage wall time (seconds) and peak memory (bytes)
+stage_seconds_buckets = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+stage_memory_buckets = tuple(2 ** power * 1024 * 1024 for power in range(5, 13))  # 32 MB to 4 GB
+stage_metrics = {'path': None, 'stages': {}, 'active': 0}  # This process's histograms, and its stages now running
+
+def reset_stage_metrics():
+    """Start this process's stage metrics afresh, in a new file.
+
+    Runs in every forked child, so it does not re-count its parent's stages, and gets a
+    new lock in case another thread held the parent's when it forked.
+    """
+    global stage_metrics_lock
+    stage_metrics_lock = threading.Lock()  # Guards stage_metrics across request threads
+    stage_metrics.update(path=None, stages={}, active=0)
+
+reset_stage_metrics()
+os.register_at_fork(after_in_child=reset_stage_metrics)
+
+def reset_peak_memory():
+    """Reset this process's peak RSS so the next reading covers only what follows (Linux only)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def peak_memory_bytes():
+    """Return this process's peak RSS since the last reset, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def record_stage_metrics(record):
+    """Add a finished stage to this process's histograms and write them to its metrics file.
+
+    Web workers, pool workers and the Redis worker each keep their own file, so
+    /metrics can sum them without shared memory. Call with stage_metrics_lock held.
+    """
+    if stage_metrics['path'] is None:
+        stage_metrics['path'] = os.path.join(METRICS_FOLDER, f"{os.getpid()}-{secrets.token_hex(4)}.json")
+        purge_stale_metrics()
+    stats = stage_metrics['stages'].setdefault(record['stage'], {
+        'count': 0, 'seconds_sum': 0.0, 'seconds_buckets': [0] * len(stage_seconds_buckets),
+        'memory_count': 0, 'memory_sum': 0, 'memory_buckets': [0] * len(stage_memory_buckets),
+        'rows_in': 0, 'rows_out': 0
+    })
+    stats['count'] += 1
+    stats['seconds_sum'] += record['seconds']
+    stats['seconds_buckets'] = [n + (record['seconds'] <= bound) for n, bound in zip(stats['seconds_buckets'], stage_seconds_buckets)]
+    if record['peak_memory_bytes'] is not None:
+        stats['memory_count'] += 1
+        stats['memory_sum'] += record['peak_memory_bytes']
+        stats['memory_buckets'] = [n + (record['peak_memory_bytes'] <= bound)
+                                   for n, bound in zip(stats['memory_buckets'], stage_memory_buckets)]
+    stats['rows_in'] += record['rows_in'] or 0
+    stats['rows_out'] += record['rows_out'] or 0
+    tmp_path = f"{stage_metrics['path']}.{secrets.token_hex(4)}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(stage_metrics['stages'], f)
+        os.replace(tmp_path, stage_metrics['path'])
+    except OSError as e:
+        logger.warning(f"Failed to write stage metrics: {str(e)}")
+
+def process_running(pid):
+    """Return whether a process with this ID is running on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # It exists but belongs to another user
+    return True
+
+def purge_stale_metrics():
+    """Remove metrics files of processes that have exited and not written for METRICS_RETENTION."""
+    for name in os.listdir(METRICS_FOLDER):
+        path = os.path.join(METRICS_FOLDER, name)
+        try:
+            if time.time() - os.path.getmtime(path) <= app.config['METRICS_RETENTION']:
+                continue
+            if name.endswith('.json') and process_running(int(name.split('-')[0])):
+                continue  # An idle process keeps its counts
+            os.remove(path)  # Includes temporary files left by a process that died mid-write
+            logger.debug(f"Removed stale metrics file: {name}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to remove metrics file {name}: {str(e)}")
+
+@contextmanager
+def stage_timer(stage, stages=None, rows_in=None):
+    """Time one request or pipeline stage: wall time, rows in and out, and peak memory.
+
+    Yields the stage record; set its 'rows_out' inside the block. The record is added
+    to the /metrics histograms, and appended to stages when a list is given, even if
+    the stage raises.
+
+    Peak memory is the whole process's peak RSS. Only a stage that starts while no
+    other stage of the process runs resets it, so stages overlapping in request
+    threads never clear each other's peak; each reports the process peak since the
+    earliest of them started.
+    """
+    record = {'stage': stage, 'rows_in': rows_in, 'rows_out': None}
+    with stage_metrics_lock:
+        if not stage_metrics['active']:
+            reset_peak_memory()
+        stage_metrics['active'] += 1
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = round(time.perf_counter() - started, 4)
+        record['peak_memory_bytes'] = peak_memory_bytes()
+        logger.debug("Stage %s: %.3fs, rows %s -> %s, peak memory %s bytes", stage, record['seconds'],
+                     record['rows_in'], record['rows_out'], record['peak_memory_bytes'])
+        with stage_metrics_lock:
+            stage_metrics['active'] -= 1
+            record_stage_metrics(record)
+        if stages is not None:
+            stages.append(record)
+
+def render_stage_metrics():
+    """Sum every process's stage metrics into Prometheus text exposition format."""
+    purge_stale_metrics()
+    totals = {}
+    for name in os.listdir(METRICS_FOLDER):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(METRICS_FOLDER, name), 'r') as f:
+                stages = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for stage, stats in stages.items():
+            total = totals.setdefault(stage, {key: [0] * len(value) if isinstance(value, list) else 0 for key, value in stats.items()})
+            for key, value in stats.items():
+                total[key] = [a + b for a, b in zip(total[key], value)] if isinstance(value, list) else total[key] + value
+    lines = []
+    for metric, buckets, prefix, help_text in (
+        ('pricing_stage_duration_seconds', stage_seconds_buckets, 'seconds', 'Wall time of each pipeline stage'),
+        ('pricing_stage_peak_memory_bytes', stage_memory_buckets, 'memory', 'Peak resident memory of the process running each pipeline stage'),
+    ):
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+        for stage, total in sorted(totals.items()):
+            count = total['count'] if prefix == 'seconds' else total['memory_count']
+            for bound, n in zip(buckets, total[f'{prefix}_buckets']):
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {n}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {round(total[f"{prefix}_sum"], 6)}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+    for direction in ('in', 'out'):
+        metric = f'pricing_stage_rows_{direction}_total'
+        lines += [f'# HELP {metric} Rows passed {"into" if direction == "in" else "out of"} each pipeline stage',
+                  f'# TYPE {metric} counter']
+        lines += [f'{metric}{{stage="{stage}"}} {total[f"rows_{direction}"]}' for stage, total in sorted(totals.items())]
+    return '\n'.join(lines) + '\n'
+
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
     logger.debug("Entering / route")
@@ -270,24 +918,20 @@ def upload_file():
                 logger.error("No file provided in upload")
                 return app.jinja_env.from_string(upload_html).render(error='<p class="error">No file selected. Please choose a file.</p>')
             
-            if not file.filename.endswith('.xlsx'):
+            if not file.filename.lower().endswith(sales_file_extensions):
                 logger.error(f"Invalid file extension: {file.filename}")
-                return app.jinja_env.from_string(upload_html).render(error='<p class="error">Please upload a valid .xlsx file.</p>')
-            
-            # Generate a unique filename with timestamp
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            sanitized_filename = sanitize_filename(file.filename)
-            file_path = os.path.join(UPLOAD_FOLDER, f"{timestamp}_{sanitized_filename}")
-            file_path = os.path.normpath(file_path)  # Normalize path for consistency
-            logger.debug(f"Saving file to: {file_path}")
+                return app.jinja_env.from_string(upload_html).render(error='<p class="error">Please upload a valid .xlsx, .csv, .parquet or .feather file.</p>')
             
             # Check write permissions for the Uploads folder
-            if not os.access(UPLOAD_FOLDER, os.W_OK):
-                logger.error(f"No write permissions for Uploads folder: {UPLOAD_FOLDER}")
+            if not os.access(BLOB_FOLDER, os.W_OK):
+                logger.error(f"No write permissions for Uploads folder: {BLOB_FOLDER}")
                 return app.jinja_env.from_string(upload_html).render(error='<p class="error">Server error: No write permissions for Uploads folder. Please contact the administrator.</p>')
             
-            # Save the file
-            file.save(file_path)
+            # Save the file under its content hash, computed while it is written
+            upload_stages = []
+            with stage_timer('upload_save', upload_stages):
+                file_path, content_hash, reused = save_upload_blob(file)
+            logger.debug(f"Saved {file.filename} as {file_path}{' (already stored)' if reused else ''}")
             
             # Verify file exists after saving
             if not os.path.exists(file_path):
@@ -298,58 +942,49 @@ def upload_file():
             file_stats = os.stat(file_path)
             logger.debug(f"File permissions for {file_path}: {oct(file_stats.st_mode)[-3:]}")
             
-            # Validate file structure
-            logger.debug(f"Validating Excel file structure: {file_path}")
-            wb = openpyxl.load_workbook(file_path)
-            sheet_names = wb.sheetnames
-            logger.debug(f"Sheet names: {sheet_names}")
-            if 'SalesbyItemBASEPRICEDECON' not in sheet_names:
+            # Validate file structure; a repeat upload reuses the stored check
+            logger.debug(f"Validating report structure: {file_path}")
+            with stage_timer('upload_validate', upload_stages):
+                workbook = validate_upload(file_path)
+            sheet_names = workbook['sheet_names']
+            if workbook['format'] is None:
+                logger.error(f"Unrecognized report format: {file_path}")
+                remove_upload_file(file_path)
+                return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Could not read {file.filename} as an .xlsx, .csv, .parquet or .feather report.</p>')
+            if workbook['columns'] is None:
                 logger.error(f"Sheet 'SalesbyItemBASEPRICEDECON' not found in {file_path}")
-                try:
-                    os.remove(file_path)
-                    logger.debug(f"Removed invalid file: {file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
+                remove_upload_file(file_path)
                 return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Sheet "SalesbyItemBASEPRICEDECON" not found in {file.filename}. Available sheets: {", ".join(sheet_names)}</p>')
             
-            df = pd.read_excel(file_path, sheet_name='SalesbyItemBASEPRICEDECON', engine='openpyxl', nrows=1)
-            actual_columns = [str(col).strip().lower() for col in df.columns]
-            logger.debug(f"Actual columns: {', '.join(df.columns)}")
-            required_columns = [
-                'Sales Price', 'Frame', 'Customer/Project: Company Name',
-                'Process', '[ES] Step Process', 'Coating', 'Foil Material',
-                'Foil Thickness', 'Colour'
-            ]
-            optional_columns = ['Customer/Project: Internal ID', 'Item: Internal ID']
-            required_columns_normalized = [col.strip().lower() for col in required_columns]
-            missing_required_columns = [col for col in required_columns if col.strip().lower() not in actual_columns]
-            missing_optional_columns = [col for col in optional_columns if col.strip().lower() not in actual_columns]
+            columns = workbook['columns']
+            missing_required_columns = workbook['missing_required']
+            missing_optional_columns = workbook['missing_optional']
             if missing_required_columns:
                 logger.warning(f"Missing required columns in Excel file: {missing_required_columns}. Cannot proceed.")
-                try:
-                    os.remove(file_path)
-                    logger.debug(f"Removed invalid file: {file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-                return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Missing required columns in {file.filename}: {", ".join(missing_required_columns)}. Found: {", ".join(df.columns)}</p>')
+                remove_upload_file(file_path)
+                return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Missing required columns in {file.filename}: {", ".join(missing_required_columns)}. Found: {", ".join(str(col) for col in columns)}</p>')
             if missing_optional_columns:
                 logger.warning(f"Missing optional columns in Excel file: {missing_optional_columns}. Proceeding with warning.")
-                session['column_warning'] = f"Missing optional columns in {file.filename}: {', '.join(missing_optional_columns)}. Found: {', '.join(df.columns)}"
+                session['column_warning'] = f"Missing optional columns in {file.filename}: {', '.join(missing_optional_columns)}. Found: {', '.join(str(col) for col in columns)}"
             else:
                 session['column_warning'] = None
                 logger.debug("Excel file validated successfully")
             
-            # Store file path in session and make it permanent
+            # Register the upload as a dataset and remember it in a permanent session
+            dataset = create_dataset(file_path, file.filename, content_hash, session['column_warning'], upload_stages)
+            purge_expired_datasets()
             session.permanent = True  # Persist session for the configured lifetime
             session['file_path'] = file_path
+            session['dataset_id'] = dataset['id']
             session['form_data'] = 'None'  # Reset form data
-            logger.debug(f"File uploaded and saved: {file_path}, stored in session['file_path']")
+            logger.debug(f"File uploaded and saved: {file_path}, stored as dataset {dataset['id']}")
             
             logger.debug("Rendering pricing form after successful upload")
             return app.jinja_env.from_string(pricing_form_html).render(
                 processes=process_step_mapping.keys(),
                 process_step_mapping=process_step_mapping,
                 form_data={},
+                dataset_id=dataset['id'],
                 error=None
             )
         except Exception as e:
@@ -359,23 +994,243 @@ def upload_file():
     logger.debug("Rendering upload page for GET request")
     return app.jinja_env.from_string(upload_html).render(error=None)
 
+# Progress reported for each pipeline stage
+job_stages = {'queued': 0, 'parsing': 10, 'repricing': 50, 'pricing': 50, 'deduplicating': 60, 'charting': 75, 'saving': 90, 'done': 100}
+
+def read_job_status(job_id):
+    """Return a job's status dict, or None if the job is unknown or expired."""
+    status_path = result_artifact_path(job_id, 'status.json')
+    try:
+        with open(status_path, 'r') as f:
+            return json.load(f)
+    except (TypeError, OSError, ValueError):
+        return None
+
+def write_job_status(job_id, **fields):
+    """Merge fields into a job's status file, written atomically so any worker process can poll it."""
+    status = read_job_status(job_id) or {'job_id': job_id, 'created': time.time()}
+    status.update(fields, updated=time.time())
+    if 'stage' in fields:
+        status['progress'] = job_stages[fields['stage']]
+    status_path = result_artifact_path(job_id, 'status.json')
+    with open(status_path + '.tmp', 'w') as f:
+        json.dump(status, f)
+    os.replace(status_path + '.tmp', status_path)
+
+def record_job_stage(job_id, record):
+    """Add a stage record to a job's status, replacing an earlier record of the same stage (e.g. a re-render)."""
+    status = read_job_status(job_id)
+    if status is None:
+        return
+    stages = [stage for stage in status.get('stages', []) if stage['stage'] != record['stage']]
+    write_job_status(job_id, stages=stages + [record])
+
+def read_sales_report(file_path, content_hash, deduplicator, column_warning=None):
+    """Parse a sales report with the engine, or reuse its cached parse.
+
+    Returns (sales_df, skipped_rows, column_warning); a cached parse keeps the
+    column_warning passed in, and leaves deduplicator as the original parse did, so
+    duplicate and row counts match either way. Raises PricingError when the report
+    cannot be read.
+    """
+    cached = load_cached_sales_data(content_hash)
+    if cached is not None:
+        # Parsed rows are reused as-is; only the pricing rules are applied again
+        sales_df, skipped_rows, row_counts, rows_seen = cached
+        if rows_seen:
+            deduplicator.restore(sales_df, row_counts, rows_seen)
+        return sales_df, skipped_rows, column_warning
+    sales_df, skipped_rows, column_warning = parse_sales_report(file_path, deduplicator)
+    store_cached_sales_data(content_hash, sales_df, skipped_rows, deduplicator)
+    return sales_df, skipped_rows, column_warning
+
+def previous_pricing(dataset):
+    """Return the results, rules and status of a dataset's last pricing run.
+
+    Returns None when there is no such run, it has expired, or its results predate the
+    stored cost components, so they cannot be re-priced in place.
+    """
+    job_id = dataset.get('priced_job_id')
+    rules_path = result_artifact_path(job_id, 'rules.json')
+    status = read_job_status(job_id)
+    try:
+        result_df = load_result_frame(job_id)
+        if not rules_path or result_df is None or status is None or not os.path.exists(rules_path):
+            return None
+        if not set(cost_component_columns) <= set(result_df.columns):
+            return None
+        with open(rules_path, 'r') as f:
+            rules = json.load(f)
+    except (OSError, ValueError) as e:
+        # The run may be purged while it is read; price from scratch instead
+        logger.debug(f"Cannot reuse pricing run {job_id}: {str(e)}")
+        return None
+    return {'job_id': job_id, 'rules': rules, 'result_df': result_df, 'status': status}
+
+def run_pricing_pipeline(job_id, dataset, rule_set, rules):
+    """Parse (or reuse), price, deduplicate and chart a dataset, storing the results under job_id.
+
+    When the dataset was priced before, its stored results are re-priced in place
+    instead: only rows whose process or coating rules changed are recomputed. Progress
+    is recorded in the job status file.
+    Raises PricingError when the report cannot be priced.
+    """
+    file_path = dataset['file_path']
+    stages = []  # Timings of each stage, kept in the job status for /debug
+    previous = previous_pricing(dataset) if app.config['INCREMENTAL_REPRICING'] else None
+    if previous is not None:
+        # Deduplication does not depend on the rules, so the previous run's rows can be reused as they are
+        write_job_status(job_id, state='running', stage='repricing')
+        with stage_timer('reprice', stages, rows_in=len(previous['result_df'])) as stage:
+            result_df, changed = reprice_results(previous['result_df'], compile_pricing_rules(previous['rules']), rule_set)
+            stage['rows_out'] = int(changed.sum())
+        logger.debug(f"Re-priced {changed.sum()} of {len(result_df)} rows from job {previous['job_id']}")
+        duplicates = previous['status'].get('duplicates', 0)
+        column_warning = previous['status'].get('column_warning')
+    else:
+        write_job_status(job_id, state='running', stage='parsing')
+        deduplicator = RowDeduplicator()
+        with stage_timer('parse', stages) as stage:
+            try:
+                sales_df, skipped_rows, column_warning = read_sales_report(file_path, dataset['content_hash'], deduplicator,
+                                                                           dataset['column_warning'])
+            except PricingError:
+                if os.path.exists(file_path):
+                    remove_dataset(dataset)  # The stored file itself cannot be priced
+                raise
+            stage['rows_out'] = len(sales_df)
+        write_job_status(job_id, stage='pricing')
+        with stage_timer('price', stages, rows_in=len(sales_df)) as stage:
+            result_df = price_sales_data(sales_df, skipped_rows, rule_set, file_path, deduplicator)
+            stage['rows_out'] = len(result_df)
+        
+        # Remove duplicates by customer, material, and sales price combination
+        write_job_status(job_id, stage='deduplicating')
+        with stage_timer('deduplicate', stages, rows_in=len(result_df)) as stage:
+            result_df = deduplicate_results(result_df, deduplicator, file_path)
+            stage['rows_out'] = len(result_df)
+        duplicates = deduplicator.duplicates
+    
+    # Aggregate the lowest Base Cost by Customer chart; the results page draws it in the browser
+    write_job_status(job_id, stage='charting')
+    with stage_timer('chart', stages, rows_in=len(result_df)) as stage:
+        try:
+            # One pass over the deduplicated rows; cheaper than patching the customers of re-priced rows
+            chart = build_chart_data(result_df)
+            stage['rows_out'] = chart['customers']
+            logger.debug("Chart data generated successfully")
+        except Exception as e:
+            logger.error(f"Error generating chart data: {str(e)}")
+            chart = None  # Retried from the stored results when the page asks for it
+    
+    # Store results under the job ID; CSV/XLSX exports are built on first download
+    write_job_status(job_id, stage='saving')
+    with stage_timer('save', stages, rows_in=len(result_df)):
+        try:
+            data_path = result_artifact_path(job_id, 'results.parquet')
+            result_df.to_parquet(data_path, index=False)
+            if chart is not None:
+                store_chart_data(result_artifact_path(job_id, 'chart.json'), chart)
+            # The rules go last: a run is only reused for re-pricing once they are there
+            with open(result_artifact_path(job_id, 'rules.json'), 'w') as f:
+                json.dump(rules, f)
+            logger.debug(f"Results saved to {data_path}")
+        except Exception as e:
+            logger.error(f"Error saving results: {str(e)}")
+            raise PricingError(f'<p class="error">Error saving results: {str(e)}. Please try again.</p>')
+    write_job_status(job_id, state='done', stage='done', rows=len(result_df), duplicates=duplicates,
+                     column_warning=column_warning, stages=stages, incremental=previous is not None)
+    # The next pricing run of this dataset starts from these results
+    dataset['priced_job_id'] = job_id
+    save_dataset(dataset)
+
+def run_pricing_job(job_id, dataset_id, rules):
+    """Background entry point: price a stored dataset and record the outcome in the job status."""
+    try:
+        dataset = load_dataset(dataset_id)
+        if not dataset:
+            raise PricingError('<p class="error">The uploaded report has expired. Please upload the Excel file again.</p>')
+        run_pricing_pipeline(job_id, dataset, compile_pricing_rules(rules), rules)
+    except PricingError as e:
+        write_job_status(job_id, state='failed', message=str(e))
+    except Exception as e:
+        logger.error(f"Error in background job {job_id}: {str(e)}")
+        write_job_status(job_id, state='failed', message=f'<p class="error">Error processing report: {str(e)}. Please try again.</p>')
+
+job_executor = None
+
+def submit_pricing_job(job_id, dataset_id, rules):
+    """Queue a pricing run on Redis when REDIS_URL is configured, otherwise on a local process pool."""
+    global job_executor
+    write_job_status(job_id, state='queued', stage='queued', dataset_id=dataset_id)
+    if app.config['REDIS_URL']:
+        import redis  # Only needed when a Redis queue is configured
+        client = redis.Redis.from_url(app.config['REDIS_URL'])
+        client.rpush(app.config['JOB_QUEUE_KEY'], json.dumps({'job_id': job_id, 'dataset_id': dataset_id, 'rules': rules}))
+        logger.debug(f"Queued job {job_id} on Redis")
+        return
+    if job_executor is None:
+        # Created on first use so each gunicorn worker owns its pool after forking
+        job_executor = ProcessPoolExecutor(max_workers=app.config['JOB_WORKERS'])
+    future = job_executor.submit(run_pricing_job, job_id, dataset_id, rules)
+
+    def record_crash(done):
+        # run_pricing_job records its own errors; this only catches a worker process dying
+        if done.exception():
+            write_job_status(job_id, state='failed', message=f'<p class="error">Background worker failed: {str(done.exception())}</p>')
+    future.add_done_callback(record_crash)
+    logger.debug(f"Queued job {job_id} on the local process pool")
+
+def run_redis_worker():
+    """Consume pricing jobs from the Redis queue until interrupted."""
+    import redis  # Only needed when a Redis queue is configured
+    client = redis.Redis.from_url(app.config['REDIS_URL'])
+    logger.info(f"Waiting for jobs on {app.config['JOB_QUEUE_KEY']}")
+    while True:
+        _, payload = client.blpop(app.config['JOB_QUEUE_KEY'])
+        job = json.loads(payload)
+        logger.info(f"Running job {job['job_id']}")
+        run_pricing_job(job['job_id'], job['dataset_id'], job['rules'])
+
+def render_job_results(job_id, dataset_id):
+    """Render the results page for a finished job."""
+    status = read_job_status(job_id)
+    column_warning = status.get('column_warning')
+    if column_warning:
+        logger.debug(f"Rendering results with column warning: {column_warning}")
+    else:
+        logger.debug("Rendering results page")
+    with stage_timer('render') as stage:
+        html = app.jinja_env.from_string(results_html).render(
+            row_count=status['rows'],
+            columns=result_column_labels,
+            page_size=app.config['RESULTS_PAGE_SIZE'],
+            plotly_version=plotly_bundle()[1],
+            dataset_id=dataset_id,
+            job_id=job_id,
+            error=f'<p class="error">Warning: {column_warning}</p>' if column_warning else None
+        )
+    record_job_stage(job_id, stage)
+    return html
+
 @app.route('/pricing', methods=['GET', 'POST'])
 def pricing_form():
+    dataset_id = request.values.get('dataset_id') or session.get('dataset_id')
     if request.method == 'GET':
+        if load_dataset(dataset_id):
+            logger.debug(f"Accessed /pricing via GET for dataset {dataset_id}")
+            return app.jinja_env.from_string(pricing_form_html).render(
+                processes=process_step_mapping.keys(),
+                process_step_mapping=process_step_mapping,
+                form_data={},
+                dataset_id=dataset_id,
+                error=None
+            )
         logger.debug("Accessed /pricing via GET, redirecting to upload page")
         return app.jinja_env.from_string(upload_html).render(error='<p class="error">Please upload a file first.</p>')
     
     logger.debug("Processing pricing form submission")
     
-    global pricing_rules
-    pricing_rules = {
-        "Process": {},
-        "Coating": {},
-        "Foil Material": {},
-        "Foil Thickness": {},
-        "Colour": {}
-    }
-    
     # Initialize form_data
     form_data = {}
     
@@ -384,82 +1239,15 @@ def pricing_form():
     if pricing_file and pricing_file.filename.endswith('.txt'):
         try:
             logger.debug(f"Processing uploaded pricing file: {pricing_file.filename}")
-            # Save the pricing file temporarily
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            sanitized_pricing_filename = sanitize_filename(pricing_file.filename)
-            pricing_file_path = os.path.join(UPLOAD_FOLDER, f"{timestamp}_{sanitized_pricing_filename}")
-            pricing_file_path = os.path.normpath(pricing_file_path)
-            logger.debug(f"Saving pricing file to: {pricing_file_path}")
-            pricing_file.save(pricing_file_path)
-            
-            # Verify pricing file exists
-            if not os.path.exists(pricing_file_path):
-                logger.error(f"Pricing file not found after saving: {pricing_file_path}")
-                return app.jinja_env.from_string(pricing_form_html).render(
-                    processes=process_step_mapping.keys(),
-                    process_step_mapping=process_step_mapping,
-                    form_data=form_data,
-                    error=f'<p class="error">Failed to save pricing file: {pricing_file.filename}. Please check disk space or permissions and try again.</p>'
-                )
-            
-            # Parse the pricing file
-            with open(pricing_file_path, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if ':' not in line:
-                        continue
-                    key, value = [part.strip() for part in line.split(':', 1)]
-                    try:
-                        value = float(value)
-                    except ValueError:
-                        logger.warning(f"Invalid price value in pricing file for {key}: {value}")
-                        continue
-                    
-                    # Normalize key for comparison
-                    key = key.lower().replace('lasterstep', 'laserstep').replace('laststep', 'laserstep')
-                    
-                    # Map keys to form_data
-                    if key.startswith('chem '):
-                        step = key[5:]  # Keep exact format (e.g., "5 or more")
-                        if step == '5 or more' or step.title() in process_step_mapping["Chemetch"]:
-                            form_data[f"Chemetch_{step if step == '5 or more' else step.title()}"] = str(value)
-                            logger.debug(f"Set form_data[Chemetch_{step if step == '5 or more' else step.title()}]: {value}")
-                    elif key.startswith('laserstep '):
-                        step = key[10:]  # Keep exact format (e.g., "1-2")
-                        if step in process_step_mapping["LaserSTEP"]:
-                            form_data[f"LaserSTEP_{step}"] = str(value)
-                            logger.debug(f"Set form_data[LaserSTEP_{step}]: {value}")
-                        # Default to 1-20 price for new ranges if not specified
-                        elif step in ["21-30", "31-40", "41-50", "51-60"]:
-                            form_data[f"LaserSTEP_{step}"] = str(245)  # Use 1-20 price
-                            logger.debug(f"Set form_data[LaserSTEP_{step}]: 245 (default from 1-20)")
-                    elif key.startswith('mill '):
-                        step = key[5:].title()  # Convert to title case (e.g., "single" → "Single")
-                        if step in process_step_mapping["Milled"]:
-                            form_data[f"Milled_{step}"] = str(value)
-                            logger.debug(f"Milled_{step}: {value}")
-                    elif key == 'double':  # Handle ambiguous "double" (assume Milled_Double)
-                        form_data["Milled_Double"] = str(value)
-                        logger.warning(f"Ambiguous key 'double' mapped to Milled_Double: {value}")
-                    elif key.startswith('coat '):
-                        coating = key[5:].title().replace('Bluprint', 'BluPrint')  # Handle title case and BluPrint
-                        if coating in ["Advanced Nano", "Nano Wipe", "Nano Slic", "BluPrint"]:
-                            form_data[f"Coating_{coating}"] = str(value)
-                            logger.debug(f"Set form_data[Coating_{coating}]: {value}")
-            
-            # Clean up the pricing file
-            try:
-                os.remove(pricing_file_path)
-                logger.debug(f"Removed temporary pricing file: {pricing_file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to remove pricing file {pricing_file_path}: {str(e)}")
+            # Parse the pricing file straight from the upload; save the result as a rule set to reuse it
+            form_data = parse_pricing_file(pricing_file.stream.read().decode('utf-8-sig').splitlines())
             
             # Log form_data for debugging
             logger.debug(f"Form data after pricing file parsing: {form_data}")
             
-            # Ensure session is still valid
-            if not session.get('file_path'):
-                logger.error("Session file_path missing after pricing file upload")
+            # Ensure the uploaded report is still available
+            if not load_dataset(dataset_id):
+                logger.error(f"Dataset {dataset_id} missing after pricing file upload")
                 return app.jinja_env.from_string(upload_html).render(error='<p class="error">Session expired or no Excel file uploaded. Please upload the Excel file again.</p>')
             
             # Render the pricing form with pre-filled values
@@ -467,6 +1255,7 @@ def pricing_form():
                 processes=process_step_mapping.keys(),
                 process_step_mapping=process_step_mapping,
                 form_data=form_data,
+                dataset_id=dataset_id,
                 error=None
             )
         except Exception as e:
@@ -475,47 +1264,33 @@ def pricing_form():
                 processes=process_step_mapping.keys(),
                 process_step_mapping=process_step_mapping,
                 form_data=form_data,
-                error=f'<p class="error">Error processing pricing file: {pricing_file.filename}. Please check disk space or permissions and try again.</p>'
+                dataset_id=dataset_id,
+                error=f'<p class="error">Error processing pricing file: {pricing_file.filename}. Please check the file is UTF-8 text and try again.</p>'
             )
     
-    # Process form data (manual entry or after file import)
+    # Process form data (manual entry, after file import, or a saved rule set)
     try:
         form_data = {key: value for key, value in request.form.items()}
         session['form_data'] = str(form_data)[:1000]  # Truncate for debug display
         logger.debug(f"Form data received: {form_data}")
-        non_zero_prices = False
-        for process in process_step_mapping:
-            pricing_rules["Process"][process] = {}
-            for step in process_step_mapping[process]:
-                cost = request.form.get(f"{process}_{step}", "0")
-                try:
-                    cost_value = float(cost) if cost.strip() else 0
-                    # Apply 1-20 price (245) for LaserSTEP ranges >= 21-30 if not specified
-                    if process == "LaserSTEP" and step in ["21-30", "31-40", "41-50", "51-60"] and cost_value == 0:
-                        cost_value = pricing_rules["Process"]["LaserSTEP"].get("1-20", 245)
-                        logger.debug(f"Applied default price for {process}_{step}: {cost_value} (from 1-20)")
-                    pricing_rules["Process"][process][step] = cost_value
-                    if cost_value != 0:
-                        non_zero_prices = True
-                    logger.debug(f"Set price for {process}_{step}: {cost_value}")
-                except ValueError:
-                    logger.warning(f"Invalid cost value for {process}_{step}: {cost}")
-                    pricing_rules["Process"][process][step] = 0
-        
-        for coating in ["Advanced Nano", "Nano Wipe", "Nano Slic", "BluPrint"]:
-            cost = request.form.get(f"Coating_{coating}", "0")
-            try:
-                cost_value = float(cost) if cost.strip() else 0
-                pricing_rules["Coating"][coating] = cost_value
-                if cost_value != 0:
-                    non_zero_prices = True
-                logger.debug(f"Set price for Coating_{coating}: {cost_value}")
-            except ValueError:
-                logger.warning(f"Invalid cost value for Coating_{coating}: {cost}")
-                pricing_rules["Coating"][coating] = 0
-        
-        # Log pricing_rules for debugging
-        logger.debug(f"Final pricing_rules: {pricing_rules}")
+        saved_rules_id = request.form.get('saved_rules', '')
+        if saved_rules_id:
+            # Saved rule sets were validated when stored, so only the compiled lookup is needed
+            saved = load_rule_set(app.config['RULES_DB'], saved_rules_id)
+            if saved is None:
+                return app.jinja_env.from_string(pricing_form_html).render(
+                    processes=process_step_mapping.keys(),
+                    process_step_mapping=process_step_mapping,
+                    form_data=form_data,
+                    dataset_id=dataset_id,
+                    error='<p class="error">The selected rule set no longer exists. Please choose another or enter prices.</p>'
+                )
+            logger.debug(f"Using saved rule set {saved['name']} v{saved['version']}")
+            rules, non_zero_prices = saved['rules'], True
+            rule_set = compiled_rule_set(app.config['RULES_DB'], saved['id'])
+        else:
+            rules, non_zero_prices = parse_pricing_rules(request.form)
+            rule_set = compile_pricing_rules(rules)
         
         # Check if any non-zero prices were set
         if not non_zero_prices:
@@ -524,302 +1299,235 @@ def pricing_form():
                 processes=process_step_mapping.keys(),
                 process_step_mapping=process_step_mapping,
                 form_data=form_data,
+                dataset_id=dataset_id,
                 error='<p class="error">Please provide at least one non-zero pricing rule.</p>'
             )
+        rule_set_name = request.form.get('rule_set_name', '').strip()
+        if rule_set_name and not saved_rules_id:
+            save_rule_set(app.config['RULES_DB'], rule_set_name, rules)
     except Exception as e:
         logger.error(f"Error processing form data: {str(e)}")
         return app.jinja_env.from_string(pricing_form_html).render(
             processes=process_step_mapping.keys(),
             process_step_mapping=process_step_mapping,
             form_data=form_data,
+            dataset_id=dataset_id,
             error=f'<p class="error">Error processing pricing form: {str(e)}. Please try again.</p>'
         )
     
-    # Process uploaded Excel file
-    file_path = session.get('file_path')
-    logger.debug(f"Checking session file_path: {file_path}")
-    if not file_path:
-        logger.error("No file path found in session")
-        return app.jinja_env.from_string(upload_html).render(error='<p class="error">No Excel file path found in session. Please upload the Excel file again. Ensure cookies are enabled in your browser.</p>')
-    if not os.path.exists(file_path):
-        logger.error(f"File does not exist on disk: {file_path}")
-        return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Uploaded Excel file not found on disk: {os.path.basename(file_path)}. It may have been deleted, moved, or not saved properly. Please upload again.</p>')
+    # Process the uploaded report
+    dataset = load_dataset(dataset_id)
+    logger.debug(f"Checking dataset: {dataset_id}")
+    if not dataset:
+        logger.error(f"No stored dataset found for {dataset_id}")
+        return app.jinja_env.from_string(upload_html).render(error='<p class="error">No uploaded report found for this session, or it has expired. Please upload the Excel file again. Ensure cookies are enabled in your browser.</p>')
+    dataset['last_used'] = time.time()
+    save_dataset(dataset)
+    session['dataset_id'] = dataset_id
+    purge_expired_results()
+    job_id = create_result_job()
+    session['job_id'] = job_id
+    
+    if request.form.get('background'):
+        # Hand the run to the job queue and answer immediately
+        submit_pricing_job(job_id, dataset_id, rules)
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(job_id=job_id, status_url=f'/jobs/{job_id}', results_url=f'/jobs/{job_id}/results'), 202
+        return app.jinja_env.from_string(job_html).render(job_id=job_id)
     
     try:
-        logger.debug(f"Validating file before processing: {file_path}")
-        # Check file permissions
-        if not os.access(file_path, os.R_OK):
-            logger.error(f"No read permissions for file: {file_path}")
-            try:
-                os.remove(file_path)
-                logger.debug(f"Removed invalid file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-            return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">No read permissions for file: {os.path.basename(file_path)}. Please check file permissions and upload again.</p>')
-        
-        wb = openpyxl.load_workbook(file_path)
-        sheet_names = wb.sheetnames
-        logger.debug(f"Sheet names: {sheet_names}")
-        if 'SalesbyItemBASEPRICEDECON' not in sheet_names:
-            logger.error(f"Sheet 'SalesbyItemBASEPRICEDECON' not found in {file_path}")
-            try:
-                os.remove(file_path)
-                logger.debug(f"Removed invalid file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-            return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Sheet "SalesbyItemBASEPRICEDECON" not found in {os.path.basename(file_path)}. Available sheets: {", ".join(sheet_names)}</p>')
-        
-        df = pd.read_excel(file_path, sheet_name='SalesbyItemBASEPRICEDECON', engine='openpyxl')
-        logger.debug(f"Excel file read successfully: {file_path}, {len(df)} rows")
-        actual_columns = [str(col).strip().lower() for col in df.columns]
-        logger.debug(f"Actual columns: {', '.join(df.columns)}")
-        required_columns = [
-            'Sales Price', 'Frame', 'Customer/Project: Company Name',
-            'Process', '[ES] Step Process', 'Coating', 'Foil Material',
-            'Foil Thickness', 'Colour'
-        ]
-        optional_columns = ['Customer/Project: Internal ID', 'Item: Internal ID']
-        required_columns_normalized = [col.strip().lower() for col in required_columns]
-        missing_required_columns = [col for col in required_columns if col.strip().lower() not in actual_columns]
-        missing_optional_columns = [col for col in optional_columns if col.strip().lower() not in actual_columns]
-        if missing_required_columns:
-            logger.error(f"Missing required columns in Excel file: {missing_required_columns}")
+        run_pricing_pipeline(job_id, dataset, rule_set, rules)
+    except PricingError as e:
+        return app.jinja_env.from_string(upload_html).render(error=str(e))
+    except Exception as e:
+        logger.error(f"Error processing Excel file: {str(e)}")
+        return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Error reading Excel file {os.path.basename(dataset["file_path"])}: {str(e)}. Please try again.</p>')
+    return render_job_results(job_id, dataset_id)
+
+@app.route('/rule_sets')
+def rule_sets():
+    """List saved rule set versions as JSON."""
+    return jsonify(list_rule_sets(app.config['RULES_DB']))
+
+@app.route('/batch', methods=['POST'])
+def batch_deconstruct():
+    """Price several uploaded reports against one rule set in parallel.
+
+    Takes reports as "files" and rules as saved_rules, pricing_file or pricing form
+    fields. Answers with a result job per report and one for the combined results,
+    each usable with /download, /download_excel and /results/data.
+    """
+    reports = [f for f in request.files.getlist('files') if f and f.filename]
+    if not reports:
+        return jsonify(error='No reports uploaded. Send each report as a "files" field.'), 400
+    invalid = [f.filename for f in reports if not f.filename.lower().endswith(sales_file_extensions)]
+    if invalid:
+        return jsonify(error=f'Unsupported report types: {", ".join(invalid)}. Use .xlsx, .csv, .parquet or .feather.'), 400
+    pricing_file = request.files.get('pricing_file')
+    pricing_lines = pricing_file.stream.read().decode('utf-8-sig').splitlines() if pricing_file and pricing_file.filename else None
+    resolved = resolve_rules(app.config['RULES_DB'], request.form.get('saved_rules'), pricing_lines, request.form)
+    if resolved is None:
+        return jsonify(error='The selected rule set does not exist.'), 400
+    rules, non_zero_prices = resolved
+    if not non_zero_prices:
+        return jsonify(error='Please provide at least one non-zero pricing rule.'), 400
+
+    purge_expired_results()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    file_paths = []
+    try:
+        for i, report in enumerate(reports):
+            file_path = os.path.normpath(os.path.join(UPLOAD_FOLDER, f"{timestamp}_batch{i}_{sanitize_filename(report.filename)}"))
+            report.save(file_path)
+            file_paths.append(file_path)
+        job_ids = [create_result_job() for _ in file_paths]
+        output_paths = [result_artifact_path(job_id, 'results.parquet') for job_id in job_ids]
+        with stage_timer('batch') as stage:
+            summaries, combined_df = run_batch(file_paths, rules, output_paths, names=[report.filename for report in reports])
+            stage['rows_out'] = 0 if combined_df is None else len(combined_df)
+    finally:
+        for file_path in file_paths:
             try:
                 os.remove(file_path)
-                logger.debug(f"Removed invalid file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-            return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Missing required columns in {os.path.basename(file_path)}: {", ".join(missing_required_columns)}. Found: {", ".join(df.columns)}</p>')
-        if missing_optional_columns:
-            logger.warning(f"Missing optional columns in Excel file: {missing_optional_columns}. Proceeding with warning.")
-            session['column_warning'] = f"Missing optional columns in {os.path.basename(file_path)}: {', '.join(missing_optional_columns)}. Found: {', '.join(df.columns)}"
+            except OSError as e:
+                logger.warning(f"Failed to remove batch report {file_path}: {str(e)}")
+
+    report_results = []
+    for job_id, summary in zip(job_ids, summaries):
+        if summary['error']:
+            write_job_status(job_id, state='failed', stage='done', message=summary['error'])
         else:
-            session['column_warning'] = None
-            logger.debug("Excel file validated successfully")
-        
-        results = []
-        skipped_rows = []
-        for index, row in df.iterrows():
-            try:
-                # Check for missing required fields
-                missing_fields = []
-                if pd.isna(row['Sales Price']):
-                    missing_fields.append('Sales Price')
-                if pd.isna(row['Frame']):
-                    missing_fields.append('Frame')
-                if pd.isna(row['Customer/Project: Company Name']):
-                    missing_fields.append('Customer/Project: Company Name')
-                if missing_fields:
-                    skipped_rows.append((index, f"Missing required fields: {', '.join(missing_fields)}"))
-                    logger.debug(f"Skipping row {index} due to missing required fields: {', '.join(missing_fields)}")
-                    continue
-                
-                process = str(row['Process']).strip() if not pd.isna(row['Process']) else 'Unknown'
-                step_process = str(row['[ES] Step Process']).strip() if not pd.isna(row['[ES] Step Process']) else 'None'
-                if process == 'LaserSTEP':
-                    step_process = re.sub(r'\s*-\s*', '-', step_process)
-                    logger.debug(f"Normalized step_process for LaserSTEP: {step_process}")
-                coating = str(row['Coating']).strip() if not pd.isna(row['Coating']) else 'None'
-                foil_material = str(row['Foil Material']).strip() if not pd.isna(row['Foil Material']) else 'Unknown'
-                foil_thickness = str(row['Foil Thickness']).strip() if not pd.isna(row['Foil Thickness']) else 'Unknown'
-                colour = str(row['Colour']).strip() if not pd.isna(row['Colour']) else 'Unknown'
-                customer = str(row['Customer/Project: Company Name']).strip() if not pd.isna(row['Customer/Project: Company Name']) else 'Unknown'
-                customer_internal_id = str(row.get('Customer/Project: Internal ID', 'Unknown')).strip()
-                item_internal_id = str(row.get('Item: Internal ID', 'Unknown')).strip()
-                
-                try:
-                    sales_price = float(row['Sales Price'])
-                except (ValueError, TypeError) as e:
-                    skipped_rows.append((index, f"Invalid Sales Price: {row['Sales Price']}"))
-                    logger.warning(f"Invalid Sales Price in row {index}: {row['Sales Price']}")
-                    continue
-                
-                attribute_cost = 0
-                if process != 'LaserCut':
-                    if process in pricing_rules["Process"]:
-                        logger.debug(f"Available steps for {process}: {list(pricing_rules['Process'][process].keys())}")
-                        if step_process in pricing_rules["Process"][process]:
-                            attribute_cost += pricing_rules["Process"][process][step_process]
-                            logger.debug(f"Applied process cost: {process}_{step_process} = {pricing_rules['Process'][process][step_process]}")
-                        else:
-                            logger.warning(f"Invalid step_process in row {index}: {step_process} for process {process}")
-                    else:
-                        logger.warning(f"Invalid process in row {index}: {process}")
-                    if coating in pricing_rules["Coating"]:
-                        attribute_cost += pricing_rules["Coating"][coating]
-                        logger.debug(f"Applied coating cost: Coating_{coating} = {pricing_rules['Coating'][coating]}")
-                    else:
-                        logger.warning(f"Invalid coating in row {index}: {coating}")
-                
-                base_cost = sales_price - attribute_cost
-                
-                results.append({
-                    'Customer': customer,
-                    'Customer_Internal_ID': customer_internal_id,
-                    'Frame': str(row['Frame']).strip(),
-                    'Item_Internal_ID': item_internal_id,
-                    'Sales_Price': sales_price,
-                    'Process': process,
-                    'Step_Process': step_process,
-                    'Coating': coating,
-                    'Foil_Material': foil_material,
-                    'Foil_Thickness': foil_thickness,
-                    'Colour': colour,
-                    'Attribute_Cost': attribute_cost,
-                    'Base_Cost': base_cost
-                })
-            except Exception as e:
-                skipped_rows.append((index, f"Error processing row: {str(e)}"))
-                logger.warning(f"Error processing row {index}: {str(e)}")
-                continue
-        
-        if not results:
-            logger.error(f"No valid data processed from Excel file. Skipped {len(skipped_rows)} rows.")
-            error_message = f'<p class="error">No valid data found in Excel file {os.path.basename(file_path)}. Reasons for skipping rows:<br>'
-            error_message += '<ul>' + ''.join(f'<li>Row {row_idx}: {reason}</li>' for row_idx, reason in skipped_rows[:10]) + '</ul>'
-            if len(skipped_rows) > 10:
-                error_message += f'<p>And {len(skipped_rows) - 10} more rows skipped. Check the debug log for details.</p>'
-            error_message += '<p>Please check the file contents (e.g., ensure Sales Price, Frame, and Customer/Project: Company Name are populated).</p>'
-            try:
-                os.remove(file_path)
-                logger.debug(f"Removed invalid file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-            return app.jinja_env.from_string(upload_html).render(error=error_message)
-        
-        # Remove duplicates by customer, material, and sales price combination
-        try:
-            result_df = pd.DataFrame(results)
-            logger.debug(f"Processed {len(result_df)} rows before duplicate removal")
-            if result_df.empty:
-                logger.error("DataFrame is empty after processing")
-                try:
-                    os.remove(file_path)
-                    logger.debug(f"Removed invalid file: {file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-                return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">No valid data after processing {os.path.basename(file_path)}. Please check the file contents.</p>')
-            # Ensure Customer and Sales_Price are valid
-            if 'Customer' not in result_df.columns or 'Sales_Price' not in result_df.columns:
-                logger.error(f"Missing critical columns in DataFrame: {result_df.columns}")
-                try:
-                    os.remove(file_path)
-                    logger.debug(f"Removed invalid file: {file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-                return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Missing critical columns in {os.path.basename(file_path)}: {", ".join(result_df.columns)}</p>')
-            # Handle non-string Customers or non-numeric Sales_Price
-            result_df['Customer'] = result_df['Customer'].astype(str)
-            result_df['Customer_Internal_ID'] = result_df['Customer_Internal_ID'].astype(str)
-            result_df['Item_Internal_ID'] = result_df['Item_Internal_ID'].astype(str)
-            result_df['Sales_Price'] = pd.to_numeric(result_df['Sales_Price'], errors='coerce')
-            result_df['Base_Cost'] = pd.to_numeric(result_df['Base_Cost'], errors='coerce')
-            if result_df['Sales_Price'].isna().all():
-                logger.error("All Sales_Price values are invalid")
-                try:
-                    os.remove(file_path)
-                    logger.debug(f"Removed invalid file: {file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-                return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">All Sales_Price values are invalid in {os.path.basename(file_path)}. Please check Sales Price data.</p>')
-            # Define columns for deduplication
-            dedup_columns = ['Customer', 'Process', 'Step_Process', 'Coating', 'Foil_Material', 'Foil_Thickness', 'Colour', 'Sales_Price']
-            # Remove exact duplicates based on customer, material attributes, and sales price
-            result_df = result_df.drop_duplicates(subset=dedup_columns, keep='first').reset_index(drop=True)
-            logger.debug(f"After duplicate removal: {len(result_df)} unique customer-material-price combinations")
-        except Exception as e:
-            logger.error(f"Error processing results: {str(e)}")
-            try:
-                os.remove(file_path)
-                logger.debug(f"Removed invalid file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-            return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Error processing results from {os.path.basename(file_path)}: {str(e)}. Please try again.</p>')
-        
-        # Generate bar chart for lowest Base Cost by Customer
-        try:
-            if result_df.empty:
-                logger.error("DataFrame is empty for chart generation")
-                chart_html = '<p class="error">No data available for chart</p>'
-            else:
-                # For the chart, group by Customer and take the minimum Base_Cost
-                chart_df = result_df.loc[result_df.groupby('Customer')['Base_Cost'].idxmin()]
-                fig = px.bar(chart_df, x='Customer', y='Base_Cost', title='Lowest Base Cost by Customer',
-                             labels={'Base_Cost': 'Base Cost ($)', 'Customer': 'Customer'})
-                fig.update_layout(xaxis_tickangle=45)
-                chart_html = pio.to_html(fig, full_html=False)
-                logger.debug("Bar chart generated successfully")
-        except Exception as e:
-            logger.error(f"Error generating chart: {str(e)}")
-            chart_html = f'<p class="error">Error generating chart: {str(e)}</p>'
-        
-        # Save results to CSV and Excel
-        csv_path = os.path.join(UPLOAD_FOLDER, 'results.csv')
-        excel_path = os.path.join(UPLOAD_FOLDER, 'results.xlsx')
-        try:
-            result_df.to_csv(csv_path, index=False)
-            result_df.to_excel(excel_path, index=False, engine='openpyxl')
-            logger.debug(f"Results saved to {csv_path} and {excel_path}")
-        except Exception as e:
-            logger.error(f"Error saving results: {str(e)}")
-            try:
-                os.remove(file_path)
-                logger.debug(f"Removed invalid file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-            return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Error saving results: {str(e)}. Please try again.</p>')
-        
-        # Clean up the uploaded Excel file after processing
-        try:
-            os.remove(file_path)
-            logger.debug(f"Removed uploaded Excel file: {file_path}")
-        except Exception as e:
-            logger.warning(f"Failed to remove Excel file {file_path}: {str(e)}")
-        
-        # Include column warning if any
-        column_warning = session.get('column_warning')
-        if column_warning:
-            logger.debug(f"Rendering results with column warning: {column_warning}")
-            return app.jinja_env.from_string(results_html).render(
-                data=result_df.to_dict('records'),
-                chart=chart_html,
-                error=f'<p class="error">Warning: {column_warning}</p>'
-            )
-        
-        logger.debug("Rendering results page")
-        return app.jinja_env.from_string(results_html).render(data=result_df.to_dict('records'), chart=chart_html)
+            write_job_status(job_id, state='done', stage='done', rows=summary['rows'], duplicates=summary['duplicates'],
+                             column_warning=summary['column_warning'])
+        report_results.append(dict(summary, job_id=job_id))
+    combined = None
+    if combined_df is not None:
+        combined_job_id = create_result_job()
+        combined_df.to_parquet(result_artifact_path(combined_job_id, 'results.parquet'), index=False)
+        write_job_status(combined_job_id, state='done', stage='done', rows=len(combined_df))
+        combined = {'job_id': combined_job_id, 'rows': len(combined_df)}
+    return jsonify(reports=report_results, combined=combined)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Return a job's state and progress as JSON."""
+    status = read_job_status(job_id)
+    if status is None:
+        return jsonify(error=f'Unknown or expired job: {job_id}'), 404
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    """Show a job's results once done, its progress while running, or its error if it failed."""
+    status = read_job_status(job_id)
+    if status is None:
+        return app.jinja_env.from_string(upload_html).render(error='<p class="error">No results available for this job. Please process the file again.</p>')
+    if status['state'] == 'failed':
+        return app.jinja_env.from_string(upload_html).render(error=status['message'])
+    if status['state'] != 'done':
+        return app.jinja_env.from_string(job_html).render(job_id=job_id)
+    session['job_id'] = job_id
+    return render_job_results(job_id, status.get('dataset_id') or session.get('dataset_id'))
+
+@app.route('/results/data')
+def results_data():
+    """Return one page of a job's results as JSON, with optional filters and sorting."""
+    job_id = request.args.get('job_id') or session.get('job_id')
+    result_df = load_result_frame(job_id)
+    if result_df is None:
+        logger.error(f"No stored results for job {job_id}")
+        return jsonify(error='No results available. Please process the file again.'), 404
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', app.config['RESULTS_PAGE_SIZE'])), 1), app.config['RESULTS_MAX_PAGE_SIZE'])
+    except ValueError:
+        return jsonify(error='offset and limit must be integers'), 400
+    sort = request.args.get('sort', '')
+    order = request.args.get('order', 'asc')
+    if sort and sort not in result_df.columns or order not in ('asc', 'desc'):
+        return jsonify(error=f'Invalid sort: {sort} {order}'), 400
+
+    mask = np.ones(len(result_df), dtype=bool)
+    customer = request.args.get('customer', '').strip()
+    if customer:
+        mask &= result_df['Customer'].str.contains(customer, case=False, regex=False).to_numpy()
+    for column, param in (('Process', 'process'), ('Coating', 'coating')):
+        if request.args.get(param):
+            mask &= (result_df[column] == request.args[param]).to_numpy()
+    page_df = result_df[mask]
+    if sort:
+        page_df = page_df.sort_values(sort, ascending=order == 'asc', kind='mergesort')
+    page_df = page_df.iloc[offset:offset + limit].drop(columns=cost_component_columns, errors='ignore')
+    return jsonify(
+        total=int(mask.sum()),
+        offset=offset,
+        limit=limit,
+        rows=page_df.astype(object).where(page_df.notna(), None).to_dict('records'),
+        options={column: sorted(result_df[column].unique().tolist()) for column in ('Process', 'Coating')}
+    )
+
+@app.route('/results/chart')
+def results_chart():
+    """Return a job's aggregated chart data as JSON; it is built once per result set and then served from disk."""
+    job_id = request.args.get('job_id') or session.get('job_id')
+    try:
+        chart_path = chart_data_path(job_id)
     except Exception as e:
-        logger.error(f"Error processing Excel file: {str(e)}")
-        try:
-            os.remove(file_path)
-            logger.debug(f"Removed invalid file: {file_path}")
-        except Exception as e:
-            logger.warning(f"Failed to remove invalid file {file_path}: {str(e)}")
-        return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Error reading Excel file {os.path.basename(file_path)}: {str(e)}. Please upload again.</p>')
+        logger.error(f"Error generating chart data for job {job_id}: {str(e)}")
+        return jsonify(error=f'Error generating chart: {str(e)}'), 500
+    if not chart_path or not os.path.exists(chart_path):
+        logger.error(f"No stored results for job {job_id}")
+        return jsonify(error='No results available. Please process the file again.'), 404
+    return send_file(os.path.abspath(chart_path), mimetype='application/json', conditional=True, max_age=0)
+
+@app.route('/assets/plotly-<version>.min.js')
+def plotly_js(version):
+    """Serve the pinned plotly.js bundle locally, so result pages work without internet access."""
+    path, bundled_version = plotly_bundle()
+    if version != bundled_version:
+        return f'plotly.js {version} is not available; this server has {bundled_version}', 404
+    # The version is in the URL, so browsers may keep the bundle until the plotly pin changes
+    return send_file(path, mimetype='text/javascript', conditional=True, max_age=365 * 24 * 3600)
+
+@app.route('/metrics')
+def metrics():
+    """Per-stage wall time and peak memory histograms and row counters, in Prometheus text format."""
+    return app.response_class(render_stage_metrics(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/download')
 def download_csv():
-    result_path = os.path.join(UPLOAD_FOLDER, 'results.csv')
-    if os.path.exists(result_path):
-        response = make_response(open(result_path, 'rb').read())
-        response.headers['Content-Disposition'] = 'attachment; filename=results.csv'
-        response.mimetype = 'text/csv'
+    try:
+        result_path = export_results(request.args.get('job_id') or session.get('job_id'), 'csv')
+    except Exception as e:
+        logger.error(f"Error generating CSV export: {str(e)}")
+        return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Error generating CSV export: {str(e)}. Please try again.</p>')
+    if result_path and os.path.exists(result_path):
         logger.debug(f"Serving CSV download: {result_path}")
-        return response
+        # Streamed from disk with Range/conditional request support
+        return send_file(os.path.abspath(result_path), mimetype='text/csv', as_attachment=True,
+                         download_name='results.csv', conditional=True, max_age=0)
     logger.error("CSV file not found for download")
     return app.jinja_env.from_string(upload_html).render(error='<p class="error">No results available for download. Please process the file again.</p>')
 
 @app.route('/download_excel')
 def download_excel():
-    result_path = os.path.join(UPLOAD_FOLDER, 'results.xlsx')
-    if os.path.exists(result_path):
-        response = make_response(open(result_path, 'rb').read())
-        response.headers['Content-Disposition'] = 'attachment; filename=results.xlsx'
-        response.mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    try:
+        result_path = export_results(request.args.get('job_id') or session.get('job_id'), 'xlsx')
+    except Exception as e:
+        logger.error(f"Error generating Excel export: {str(e)}")
+        return app.jinja_env.from_string(upload_html).render(error=f'<p class="error">Error generating Excel export: {str(e)}. Please try again.</p>')
+    if result_path and os.path.exists(result_path):
         logger.debug(f"Serving Excel download: {result_path}")
-        return response
+        return send_file(os.path.abspath(result_path), mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                         as_attachment=True, download_name='results.xlsx', conditional=True, max_age=0)
     logger.error("Excel file not found for download")
     return app.jinja_env.from_string(upload_html).render(error='<p class="error">No results available for download. Please process the file again.</p>')
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    if sys.argv[1:] == ['worker']:
+        run_redis_worker()
+    elif sys.argv[1:2] == ['batch']:
+        from pricingdeconstructor.cli import main as cli_main  # Same as `python -m pricingdeconstructor batch`
+        sys.exit(cli_main(sys.argv[1:]))
+    else:
+        app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""End-to-end pipeline benchmark on synthetic SalesbyItem reports (see synthetic.py).
+
+    python benchmarks/pipeline.py [--rows 1000 10000] [--format xlsx csv] [--repeat 3] [--json results.json]
+    python benchmarks/pipeline.py --json new.json --compare old.json
+
+Runs each report through the same steps as an upload and pricing run in the web app:
+upload save (hashed into content-addressed storage) and validation, parse, price,
+deduplicate, chart, and the CSV, XLSX and Parquet exports, each timed with the app's
+stage_timer (wall time and peak memory). Every run is a first upload: the stored copy
+and its saved validation are removed afterwards.
+Missing reports are generated first. With --compare, stages that got slower than the
+baseline by more than --tolerance are listed and the exit status is 1.
+"""
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+import tempfile
+import argparse
+
+from werkzeug.datastructures import FileStorage
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, repo_root)
+from synthetic import default_rows, ensure_reports, report_formats
+
+export_formats = ['csv', 'xlsx', 'parquet']
+noise_floor_seconds = 0.05  # Slowdowns smaller than this are not reported as regressions
+
+def run_pipeline(app, file_path, rule_set, workdir):
+    """Run one report through every stage once. Returns the stage records in order."""
+    stages = []
+    with open(file_path, 'rb') as f, app.stage_timer('upload_save', stages):
+        upload_path, _, _ = app.save_upload_blob(FileStorage(f, filename=os.path.basename(file_path)))
+    with app.stage_timer('upload_validate', stages):
+        workbook = app.validate_upload(upload_path)
+    app.remove_upload_file(upload_path)
+    if workbook['columns'] is None or workbook['missing_required']:
+        raise SystemExit(f'{file_path} is not a valid sales report')
+    deduplicator = app.RowDeduplicator()
+    with app.stage_timer('parse', stages) as stage:
+        # Straight to the engine: the app's parsed-upload cache would hide the parse after the first run
+        sales_df, skipped_rows, _ = app.parse_sales_report(file_path, deduplicator)
+        stage['rows_out'] = len(sales_df)
+    with app.stage_timer('price', stages, rows_in=len(sales_df)) as stage:
+        result_df = app.price_sales_data(sales_df, skipped_rows, rule_set, file_path, deduplicator)
+        stage['rows_out'] = len(result_df)
+    with app.stage_timer('deduplicate', stages, rows_in=len(result_df)) as stage:
+        result_df = app.deduplicate_results(result_df, deduplicator, file_path)
+        stage['rows_out'] = len(result_df)
+    with app.stage_timer('chart', stages, rows_in=len(result_df)) as stage:
+        chart = app.build_chart_data(result_df)
+        stage['rows_out'] = chart['customers']
+        json.dumps(chart)
+    for fmt in export_formats:
+        with app.stage_timer(f'export_{fmt}', stages, rows_in=len(result_df)) as stage:
+            app.write_results_file(result_df, os.path.join(workdir, f'results.{fmt}'), fmt)
+            stage['rows_out'] = len(result_df)
+    return stages
+
+def summarize(runs):
+    """Combine repeated runs of one report into per-stage medians."""
+    stages = {}
+    for records in zip(*runs):
+        seconds = [record['seconds'] for record in records]
+        memory = [record['peak_memory_bytes'] for record in records if record['peak_memory_bytes'] is not None]
+        stages[records[0]['stage']] = {
+            'median_seconds': round(statistics.median(seconds), 4),
+            'min_seconds': round(min(seconds), 4),
+            'peak_memory_bytes': max(memory) if memory else None,
+            'rows_in': records[0]['rows_in'],
+            'rows_out': records[0]['rows_out'],
+        }
+    return stages
+
+def run_benchmark(paths, repeat):
+    """Benchmark every report repeat times. Returns a results dict keyed '<rows>.<format>'."""
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # The app creates its Uploads folders (and stage metrics files) in the working directory
+        os.chdir(workdir)
+        os.environ.setdefault('LOG_LEVEL', 'ERROR')  # Unpriced-row warnings repeat on every run
+        import app
+        import openpyxl, pyarrow.parquet  # noqa: F401  Loaded on first use; the first report should not pay for the imports
+        with open(os.path.join(repo_root, 'attributePricing.txt'), encoding='utf-8-sig') as f:
+            rules, _ = app.parse_pricing_rules(app.parse_pricing_file(f.read().splitlines()))
+        rule_set = app.compile_pricing_rules(rules)
+        for (rows, fmt), file_path in paths.items():
+            started = time.perf_counter()
+            runs = [run_pipeline(app, file_path, rule_set, workdir) for _ in range(repeat)]
+            stages = summarize(runs)
+            results[f'{rows}.{fmt}'] = {
+                'rows': rows,
+                'format': fmt,
+                'file_bytes': os.path.getsize(file_path),
+                'runs': repeat,
+                'total_seconds': round(sum(stage['median_seconds'] for stage in stages.values()), 4),
+                'stages': stages,
+            }
+            print(f"{rows:>9,} rows {fmt:<8} {results[f'{rows}.{fmt}']['total_seconds']:8.3f}s  "
+                  + '  '.join(f"{name} {stage['median_seconds']:.3f}" for name, stage in stages.items())
+                  + f"  ({time.perf_counter() - started:.0f}s)")
+        os.chdir(cwd)
+    return results
+
+def compare_results(results, baseline, tolerance):
+    """List the stages slower than the baseline by more than tolerance (a fraction) and the noise floor."""
+    regressions = []
+    for case, result in results.items():
+        old_stages = baseline.get(case, {}).get('stages', {})
+        for name, stage in result['stages'].items():
+            if name not in old_stages:
+                continue
+            old, new = old_stages[name]['median_seconds'], stage['median_seconds']
+            if new > old * (1 + tolerance) and new - old > noise_floor_seconds:
+                regressions.append(f"{case} {name}: {old:.3f}s -> {new:.3f}s (+{(new - old) / old:.0%})")
+    return regressions
+
+def git_revision():
+    """The checked-out commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the pricing pipeline end to end on synthetic sales reports.')
+    parser.add_argument('--rows', type=int, nargs='+', default=default_rows, help='report sizes (default: 1k, 10k, 100k and 1M rows)')
+    parser.add_argument('--format', nargs='+', choices=report_formats, default=report_formats, help='report formats (default: all)')
+    parser.add_argument('--data-dir', default=os.path.join(benchmarks_dir, 'data'), help='synthetic report folder (default: benchmarks/data)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per report; stage times are medians (default: 3)')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file from an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline (default: 0.25)')
+    args = parser.parse_args(argv)
+    paths = ensure_reports(os.path.abspath(args.data_dir), args.rows, args.format)
+    results = run_benchmark(paths, args.repeat)
+    if args.json:
+        import pandas as pd
+        with open(args.json, 'w') as f:
+            json.dump({'revision': git_revision(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': sys.version.split()[0], 'pandas': pd.__version__, 'cpus': os.cpu_count(),
+                       'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f)['results'], args.tolerance)
+        for regression in regressions:
+            print(f"    slower than {args.compare}: {regression}")
+        if regressions:
+            return 1
+        print(f"No stage is more than {args.tolerance:.0%} slower than {args.compare}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Startup-time benchmark: how long a fresh interpreter takes to import the app and the command line tool.
+
+    python benchmarks/startup.py [--repeat 5] [--json startup.json]
+
+Each import runs in a new process (in a scratch folder, so the app's Uploads folders
+land there), timed with `python -X importtime`. Reports the median total, the
+slowest top-level imports, and whether modules that should load lazily were
+imported anyway.
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+import tempfile
+import argparse
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Module to import -> packages it must not load at import time
+targets = {
+    'app': ['plotly', 'openpyxl', 'redis'],
+    'pricingdeconstructor.cli': ['flask', 'plotly', 'openpyxl'],
+}
+
+def measure_import(module, workdir):
+    """Import module in a fresh interpreter. Returns (total microseconds, {direct import: cumulative}, loaded)."""
+    env = dict(os.environ, PYTHONPATH=repo_root)
+    code = f"import sys, {module}; print(' '.join(sorted(sys.modules)))"
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=workdir, env=env,
+                          capture_output=True, text=True, check=True)
+    entries = []  # (depth, name, cumulative) in the order importtime reports them, children before parents
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative)))
+    target = max(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == module)
+    children = {}
+    for depth, name, cumulative in reversed(entries[:target]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children[name] = cumulative
+    return entries[target][2], children, set(proc.stdout.split())
+
+def run_benchmark(repeat):
+    """Measure every target repeat times. Returns a results dict, one entry per target."""
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for module, lazy in targets.items():
+            runs = [measure_import(module, workdir) for _ in range(repeat)]
+            totals = [total for total, _, _ in runs]
+            slowest = sorted(runs[-1][1].items(), key=lambda item: -item[1])[:8]
+            loaded = runs[-1][2]
+            results[module] = {
+                'median_seconds': round(statistics.median(totals) / 1e6, 3),
+                'min_seconds': round(min(totals) / 1e6, 3),
+                'runs': repeat,
+                'slowest_imports': {name: round(us / 1e6, 3) for name, us in slowest},
+                'eagerly_loaded': [name for name in lazy if name in loaded],
+            }
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure import time of the app and the command line tool.')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per target (default: 5)')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+    results = run_benchmark(args.repeat)
+    for module, result in results.items():
+        print(f"{module}: median {result['median_seconds']:.3f}s, best {result['min_seconds']:.3f}s over {result['runs']} runs")
+        for name, seconds in result['slowest_imports'].items():
+            print(f"    {name:<32} {seconds:.3f}s")
+        if result['eagerly_loaded']:
+            print(f"    loaded at import but should be lazy: {', '.join(result['eagerly_loaded'])}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+    return 1 if any(result['eagerly_loaded'] for result in results.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
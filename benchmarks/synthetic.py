@@ -0,0 +1,184 @@
+"""Synthetic SalesbyItem reports for benchmarks, shaped like the real exports but with made-up customers.
+
+    python benchmarks/synthetic.py [--rows 1000 10000 100000 1000000] [--format xlsx csv parquet] [-o benchmarks/data]
+
+Writes SalesbyItem-SYNTHETIC-<rows>.<format> with a SalesbyItemBASEPRICEDECON sheet.
+The Process, Step Process, Coating, material and price mix follows a year of real
+sales: most rows are Lasercut or have no process, a few percent use processes the
+pricing rules do not know, some prices are blank or negative, and about three in four
+rows repeat a customer, material and price combination. The same seed always gives
+the same report.
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+
+import numpy as np
+import pandas as pd
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+from pricingdeconstructor.engine import sales_sheet_name
+
+default_rows = [1000, 10000, 100000, 1000000]
+report_formats = ['xlsx', 'csv', 'parquet']
+report_columns = [
+    'Date', 'Location: Name', 'Frame', 'Item: Internal ID', 'Process', '[ES] Step Process', 'Foil Material',
+    'Foil Thickness', 'Colour', 'Coating', 'Sales Price', 'Customer/Project: Company Name', 'Customer/Project: Internal ID'
+]
+
+# Process -> (share of rows, {step: share}, share of rows with a coating, median sales price)
+process_mix = {
+    None: (0.215, {None: 1}, 0.0, 210),
+    'Lasercut': (0.665, {None: 1}, 0.36, 225),
+    'LaserSTEP': (0.052, {'1 - 5': 0.38, '1 - 2': 0.26, '1 - 10': 0.21, '1 - 15': 0.07, '1 - 20': 0.05, '21 - 30': 0.016,
+                          '31 - 40': 0.007, '41 - 50': 0.003, '47 - 60': 0.003, '61 - 84': 0.001}, 0.72, 475),
+    'Chemetch': (0.022, {'Single': 0.79, 'Double': 0.1, 'Triple': 0.065, None: 0.036, 'Quad': 0.002, '5 or more': 0.007}, 0.74, 550),
+    'Milled': (0.001, {'Single': 0.81, 'Double': 0.06, 'Triple': 0.02, 'Quad': 0.06, '5 or more': 0.05}, 0.86, 725),
+    # Processes the pricing rules have no price for
+    'AMTX Electroform': (0.025, {None: 0.53, 'Single': 0.46, 'Double': 0.01}, 0.02, 875),
+    'MiniStencil': (0.011, {None: 1}, 0.08, 75),
+    'Rework': (0.005, {None: 1}, 0.01, 100),
+    '3D Electroform': (0.002, {'Single': 1}, 0.0, 2500),
+    'Chemetch+LaserStep': (0.002, {'Custom': 1}, 0.83, 620),
+}
+coating_mix = {'Advanced Nano': 0.587, 'Nano Wipe': 0.338, 'Nano Slic': 0.073, 'BluPrint': 0.002}
+foil_material_mix = {'PHD': 0.684, 'FG': 0.277, 'EF': 0.035, 'Nicut/SNL': 0.004}
+foil_thickness_mix = {4.0: 0.49, 5.0: 0.31, 3.0: 0.075, 6.0: 0.045, 2.0: 0.017, 3.5: 0.016, 1.5: 0.013, 1.0: 0.009,
+                      4.7: 0.009, 8.0: 0.006, 1.6: 0.005, 10.0: 0.005}
+colour_mix = {'Silver': 0.566, 'Blue': 0.216, 'Green': 0.102, 'White': 0.076, 'Not Applicable': 0.039, 'Yellow': 0.001}
+frame_mix = {
+    '29 x 29 SpaceSaver': 0.25, '23 x 23 SpaceSaver': 0.1, '23 x 23 VectorGuard Foil': 0.09, '29 x 29 Standard Tube': 0.075,
+    '29 x 29 VectorGuard Foil': 0.07, '23 x 23 QTS Foil': 0.065, '23 x 23 Standard Tube': 0.05, 'Frameless': 0.03,
+    'MiniStencil': 0.015, '23 x 29 VectorGuard Foil': 0.007, '12 x 12 SpaceSaver': 0.005, '23 x 23 Aspen Foil': 0.004,
+    '12 x 12 Cast Aluminum': 0.003, '15 x 15 Cast Aluminum': 0.002, 'Other': 0.234,
+}
+locations = ['Plant A', 'Plant B', 'Plant C', 'Plant D', 'Plant E', 'Plant F', 'Warehouse', '- No Location -']
+blank_price_share = 0.007  # Rows with no Sales Price
+non_positive_price_share = 0.017  # Credits and zero-priced rows
+repeat_share = 0.75  # Rows that repeat an earlier customer, material and price combination
+
+def choose(rng, mix, size):
+    """Draw size values from a {value: share} mix as an object array."""
+    values = list(mix)
+    shares = np.array(list(mix.values()), dtype=float)
+    picks = rng.choice(len(values), size=size, p=shares / shares.sum())
+    return np.array(values, dtype=object)[picks]
+
+def weights(rng, size):
+    """Skewed popularity for size customers or lines: a few are busy, most are occasional."""
+    popularity = rng.lognormal(0, 1.5, size)
+    return popularity / popularity.sum()
+
+def make_sales_report(rows, seed=0):
+    """Build a synthetic sales report DataFrame with the real report's columns."""
+    rng = np.random.default_rng(seed)
+    # Distinct customer/material/price lines; report rows repeat them, the busiest most often
+    lines = max(1, round(rows * (1 - repeat_share)))
+    customers = max(20, min(5000, rows // 35))
+    customer_ids = 40000 + rng.permutation(customers * 3)[:customers]
+    customer = rng.choice(customers, lines, p=weights(rng, customers))
+
+    process = choose(rng, {name: mix[0] for name, mix in process_mix.items()}, lines)
+    step = np.full(lines, None, dtype=object)
+    coating = np.full(lines, None, dtype=object)
+    median_price = np.empty(lines)
+    for name, (_, step_mix, coated_share, median) in process_mix.items():
+        in_process = pd.isna(process) if name is None else process == name
+        n = int(in_process.sum())
+        step[in_process] = choose(rng, step_mix, n)
+        coated = rng.random(n) < coated_share
+        coating[np.flatnonzero(in_process)[coated]] = choose(rng, coating_mix, int(coated.sum()))
+        median_price[in_process] = median
+    # Rows with no process mostly carry no material details either
+    has_material = pd.notna(process) | (rng.random(lines) < 0.05)
+    foil_material = np.where(has_material, choose(rng, foil_material_mix, lines), None)
+    foil_thickness = np.where(has_material, choose(rng, foil_thickness_mix, lines).astype(float), np.nan)
+    colour = np.where(has_material | (rng.random(lines) < 0.1), choose(rng, colour_mix, lines), None)
+    price = median_price * rng.lognormal(0, 0.45, lines)
+    price = np.where(rng.random(lines) < 0.7, np.round(price), np.round(price, 2))  # Mostly whole-dollar prices
+    non_positive = rng.random(lines) < non_positive_price_share
+    price[non_positive] *= -rng.choice([0, 0.5], int(non_positive.sum()), p=[0.4, 0.6])
+
+    line = rng.choice(lines, rows, p=weights(rng, lines))
+    line[:lines] = rng.permutation(lines)[:min(lines, rows)]  # Every line appears at least once
+    frame = choose(rng, frame_mix, rows)
+    other_frame = frame == 'Other'
+    frame[other_frame] = [f'{size} x {size} Custom Frame' for size in rng.choice([12, 15, 20, 23, 29], int(other_frame.sum()))]
+    frame_ids = {name: 7000 + i * 977 for i, name in enumerate(pd.unique(frame))}
+    sales_price = price[line]
+    sales_price[rng.random(rows) < blank_price_share] = np.nan
+    start = datetime.date(2024, 8, 1)
+    df = pd.DataFrame({
+        'Date': pd.to_datetime(start) + pd.to_timedelta(rng.integers(0, 376, rows), unit='D'),
+        'Location: Name': choose(rng, dict(zip(locations, [0.16, 0.15, 0.14, 0.13, 0.12, 0.11, 0.1, 0.09])), rows),
+        'Frame': frame,
+        'Item: Internal ID': np.array([frame_ids[name] for name in frame]),
+        'Process': process[line],
+        '[ES] Step Process': step[line],
+        'Foil Material': foil_material[line],
+        'Foil Thickness': foil_thickness[line],
+        'Colour': colour[line],
+        'Coating': coating[line],
+        'Sales Price': sales_price,
+        'Customer/Project: Company Name': np.array([f'Synthetic Customer {i:04d}' for i in range(customers)], dtype=object)[customer[line]],
+        'Customer/Project: Internal ID': customer_ids[customer[line]],
+    })
+    return df[report_columns]
+
+def write_sales_report(df, path, fmt):
+    """Write a synthetic report as xlsx (one SalesbyItemBASEPRICEDECON sheet), csv or parquet."""
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+    elif fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        from openpyxl import Workbook
+        # Write-only mode keeps a million-row sheet out of memory
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(sales_sheet_name)
+        sheet.append(report_columns)
+        columns = [df[col].to_numpy(dtype=object) for col in report_columns]
+        columns[0] = df['Date'].astype(object).to_numpy()  # Timestamps, which openpyxl writes as dates
+        for row in zip(*columns):
+            sheet.append([None if value is None or value != value else value for value in row])
+        workbook.save(path)
+
+def report_path(data_dir, rows, fmt):
+    """Where the synthetic report with rows rows in fmt is kept."""
+    return os.path.join(data_dir, f'SalesbyItem-SYNTHETIC-{rows}.{fmt}')
+
+def ensure_reports(data_dir, row_counts, formats, seed=0, force=False):
+    """Generate any synthetic report that is missing (or all of them with force). Returns {(rows, fmt): path}."""
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {}
+    for rows in row_counts:
+        df = None
+        for fmt in formats:
+            path = report_path(data_dir, rows, fmt)
+            paths[rows, fmt] = path
+            if os.path.exists(path) and not force:
+                continue
+            if df is None:
+                df = make_sales_report(rows, seed)
+            started = time.perf_counter()
+            write_sales_report(df, path, fmt)
+            print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s")
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic SalesbyItem reports for benchmarks.')
+    parser.add_argument('--rows', type=int, nargs='+', default=default_rows, help='report sizes (default: 1k, 10k, 100k and 1M rows)')
+    parser.add_argument('--format', nargs='+', choices=report_formats, default=report_formats, help='report formats (default: all)')
+    parser.add_argument('-o', '--output-dir', default=os.path.join(repo_root, 'benchmarks', 'data'),
+                        help='folder for the reports (default: benchmarks/data)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--force', action='store_true', help='regenerate reports that already exist')
+    args = parser.parse_args(argv)
+    ensure_reports(args.output_dir, args.rows, args.format, args.seed, args.force)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
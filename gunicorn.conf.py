@@ -0,0 +1,5 @@
+# Gunicorn settings for `gunicorn app:app` (see Procfile)
+
+# Import the app, with pandas and the pricing engine, once in the master. Forked
+# workers share those pages copy-on-write and can serve their first request at once.
+preload_app = True
@@ -0,0 +1,11 @@
+"""Sales report pricing deconstruction, usable without the web app.
+
+The engine reads xlsx, CSV, Parquet and Feather sales reports, prices them against a
+rule set and writes CSV, XLSX or Parquet results. Run `python -m pricingdeconstructor`
+for the command line tool.
+"""
+from .engine import (
+    PricingError, RowDeduplicator, RuleSet, compile_pricing_rules, deconstruct_report, parse_pricing_file,
+    parse_pricing_rules, parse_sales_report, price_sales_data, deduplicate_results, reprice_results, run_batch,
+    write_results_file
+)
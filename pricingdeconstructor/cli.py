@@ -0,0 +1,126 @@
+"""Command line tool: deconstruct sales reports without the web app.
+
+    python -m pricingdeconstructor run report.xlsx --rules attributePricing.txt -o out.parquet
+    python -m pricingdeconstructor batch reports/*.xlsx --rule-set 3 -o results --format csv
+"""
+import os
+import logging
+import re
+import time
+import argparse
+
+from . import engine
+from .rule_store import default_rules_db, resolve_rules
+
+result_formats = ['csv', 'xlsx', 'parquet']
+
+def plain_text(message):
+    """Strip the HTML markup from an engine error message for terminal output."""
+    return ' '.join(re.sub(r'<[^>]+>', ' ', message).split())
+
+def add_rules_arguments(parser):
+    """Add the --rules / --rule-set choice and --rules-db to a subcommand."""
+    rules_source = parser.add_mutually_exclusive_group(required=True)
+    rules_source.add_argument('--rules', help='attributePricing.txt-style pricing file')
+    rules_source.add_argument('--rule-set', type=int, help='ID of a saved rule set')
+    parser.add_argument('--rules-db', default=default_rules_db, help=f'saved rule set database (default: {default_rules_db})')
+
+def load_rules(parser, args):
+    """Read the pricing rules chosen on the command line, exiting with a usage error if they are unusable."""
+    pricing_lines = None
+    if args.rules:
+        if not os.path.isfile(args.rules):
+            parser.error(f'pricing file not found: {args.rules}')
+        with open(args.rules, encoding='utf-8-sig') as f:
+            pricing_lines = f.read().splitlines()
+    resolved = resolve_rules(args.rules_db, args.rule_set, pricing_lines)
+    if resolved is None:
+        parser.error(f'no saved rule set with ID {args.rule_set}')
+    rules, non_zero_prices = resolved
+    if not non_zero_prices:
+        parser.error('the rules do not set any non-zero price')
+    return rules
+
+def check_reports(parser, reports):
+    """Exit with a usage error if any report does not exist."""
+    missing = [report for report in reports if not os.path.isfile(report)]
+    if missing:
+        parser.error(f'reports not found: {", ".join(missing)}')
+
+def run_command(parser, args):
+    """Deconstruct one report in-process and write its results."""
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    if fmt not in result_formats:
+        parser.error(f'cannot tell the result format from {args.output}; use --format')
+    check_reports(parser, [args.report])
+    rules = load_rules(parser, args)
+    started = time.perf_counter()
+    summary, result_df = engine.deconstruct_report(args.report, rules, args.output, fmt)
+    if summary['error']:
+        print(f"{summary['file']}: FAILED - {plain_text(summary['error'])}")
+        return 1
+    if summary['column_warning']:
+        print(f"Warning: {summary['column_warning']}")
+    print(f"{summary['file']}: {summary['rows']} rows ({summary['duplicates']} duplicates, "
+          f"{summary['skipped']} skipped) -> {args.output} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+def batch_command(parser, args):
+    """Deconstruct many reports in parallel, writing per-report and combined results."""
+    check_reports(parser, args.reports)
+    rules = load_rules(parser, args)
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_paths = []
+    for i, report in enumerate(args.reports):
+        stem = os.path.splitext(os.path.basename(report))[0]
+        output_path = os.path.join(args.output_dir, f'{stem}.results.{args.format}')
+        if output_path in output_paths:
+            output_path = os.path.join(args.output_dir, f'{stem}.{i}.results.{args.format}')
+        output_paths.append(output_path)
+    started = time.perf_counter()
+    summaries, combined_df = engine.run_batch(args.reports, rules, output_paths, args.format)
+    for summary, output_path in zip(summaries, output_paths):
+        if summary['error']:
+            print(f"{summary['file']}: FAILED - {plain_text(summary['error'])}")
+        else:
+            print(f"{summary['file']}: {summary['rows']} rows ({summary['duplicates']} duplicates, "
+                  f"{summary['skipped']} skipped) -> {output_path}")
+    if combined_df is not None:
+        combined_path = os.path.join(args.output_dir, f'combined.results.{args.format}')
+        engine.write_results_file(combined_df, combined_path, args.format)
+        print(f"combined: {len(combined_df)} rows -> {combined_path}")
+    print(f"{len(summaries)} reports in {time.perf_counter() - started:.1f}s")
+    return 1 if any(summary['error'] for summary in summaries) else 0
+
+def main(argv=None):
+    """Parse the command line and run a subcommand. Returns the exit status."""
+    parser = argparse.ArgumentParser(prog='pricingdeconstructor',
+                                     description='Deconstruct sales reports into attribute and base costs.')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='WARNING',
+                        type=str.upper, help='log messages at this level and above (default: WARNING)')
+    parser.add_argument('--trace-rows', type=int, default=engine.config['TRACE_ROWS'], metavar='N',
+                        help='log how N sampled rows of each report were priced')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='deconstruct one report',
+                                     description='Deconstruct one sales report and write its results.')
+    run_parser.add_argument('report', help='.xlsx, .csv, .parquet or .feather sales report')
+    add_rules_arguments(run_parser)
+    run_parser.add_argument('-o', '--output', required=True, help='result file; its extension picks the format')
+    run_parser.add_argument('--format', choices=result_formats, help='result format, overriding the extension')
+    run_parser.set_defaults(handler=run_command, parser=run_parser)
+
+    batch_parser = commands.add_parser('batch', help='deconstruct several reports in parallel',
+                                       description='Deconstruct several sales reports against one rule set in parallel.')
+    batch_parser.add_argument('reports', nargs='+', help='.xlsx, .csv, .parquet or .feather sales reports')
+    add_rules_arguments(batch_parser)
+    batch_parser.add_argument('-o', '--output-dir', default='.', help='folder for the result files (default: current folder)')
+    batch_parser.add_argument('--format', choices=result_formats, default='csv', help='result file format')
+    batch_parser.set_defaults(handler=batch_command, parser=batch_parser)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    engine.config['TRACE_ROWS'] = args.trace_rows
+    if args.trace_rows:
+        engine.trace_logger.setLevel(logging.INFO)  # Asking for a trace shows it at any log level
+    return args.handler(args.parser, args)
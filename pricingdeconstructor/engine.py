@@ -0,0 +1,942 @@
+"""Sales report deconstruction engine: read a report, price it against a rule set, deduplicate and write results.
+
+Shared by the web app and the command line tool, so it must not import Flask or Plotly.
+"""
+import pandas as pd
+import numpy as np
+import os
+import logging
+import re
+import collections
+import html
+from pandas.io.parsers import TextParser
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger(__name__ + '.trace')  # Sampled per-row pricing trace, see TRACE_ROWS
+
+# Parsing, export and batch settings; the web app loads these into app.config and reads them back from there
+config = {
+    'FAST_XLSX_MIN_ROWS': 5000,  # Larger exports use openpyxl's write-only mode
+    'STREAMING_MIN_BYTES': 20 * 1024 * 1024,  # Larger workbooks are parsed in batches
+    'STREAMING_BATCH_ROWS': 5000,  # Rows per streamed batch
+    'CSV_CHUNK_ROWS': 50000,  # CSV reports are always read in chunks of this many rows
+    'BATCH_WORKERS': os.cpu_count() or 1,  # Processes for batch runs, one report per core
+    'TRACE_ROWS': int(os.environ.get('PRICING_TRACE_ROWS', 0)),  # Rows per run to log pricing details for (0: off)
+}
+
+# Process and Step Process coupling
+process_step_mapping = {
+    "Chemetch": ["Single", "Double", "Triple", "5 or more"],
+    "LaserSTEP": ["1-2", "1-5", "1-10", "1-15", "1-20", "21-30", "31-40", "41-50", "51-60"],
+    "Milled": ["Single", "Double", "Triple", "Quad"],
+    "LaserCut": []
+}
+coatings = ["Advanced Nano", "Nano Wipe", "Nano Slic", "BluPrint"]
+
+# Sales report sheet and the columns it must (or should) carry
+sales_sheet_name = 'SalesbyItemBASEPRICEDECON'
+required_columns = [
+    'Sales Price', 'Frame', 'Customer/Project: Company Name',
+    'Process', '[ES] Step Process', 'Coating', 'Foil Material',
+    'Foil Thickness', 'Colour'
+]
+optional_columns = ['Customer/Project: Internal ID', 'Item: Internal ID']
+# Accepted upload extensions; the format itself is detected from the file contents
+sales_file_extensions = ('.xlsx', '.csv', '.parquet', '.feather')
+# Low-cardinality text columns, read as categoricals
+categorical_columns = ['Process', 'Coating', 'Foil Material', 'Colour']
+
+def check_sales_header(workbook, columns):
+    """Record the sales header and which required/optional columns it lacks."""
+    actual_columns = [str(col).strip().lower() for col in columns]
+    logger.debug(f"Actual columns: {', '.join(str(col) for col in columns)}")
+    workbook['columns'] = columns
+    workbook['missing_required'] = [col for col in required_columns if col.strip().lower() not in actual_columns]
+    workbook['missing_optional'] = [col for col in optional_columns if col.strip().lower() not in actual_columns]
+
+def resolve_sales_columns(columns):
+    """Map header columns to the required/optional column each matches, ignoring case and spacing.
+
+    Only these columns are read, and they are renamed to the canonical names. When a
+    name appears twice, the first column wins.
+    """
+    canonical = {col.strip().lower(): col for col in required_columns + optional_columns}
+    resolved = {}
+    for col in columns:
+        name = canonical.get(str(col).strip().lower())
+        if name is not None and name not in resolved.values():
+            resolved[col] = name
+    return resolved
+
+def sales_read_dtypes(resolved, text_dtype=None):
+    """Explicit read dtypes for resolved columns: categoricals, and text_dtype for other text columns."""
+    dtypes = {}
+    for col, name in resolved.items():
+        if name in categorical_columns:
+            dtypes[col] = 'category'
+        elif text_dtype is not None and name != 'Sales Price':
+            dtypes[col] = text_dtype
+    return dtypes
+
+def load_sales_workbook(file_path, read_data=False):
+    """Open an uploaded workbook once, check its sales sheet header and optionally parse it.
+
+    Sheet names come from the workbook metadata and columns from the header row only,
+    read in openpyxl read-only mode. With read_data, the sales sheet is parsed from the
+    same open workbook, once, and only after the header has passed validation.
+    """
+    workbook = {'format': 'xlsx', 'sheet_names': [], 'columns': None, 'missing_required': [], 'missing_optional': [], 'df': None}
+    with pd.ExcelFile(file_path, engine='openpyxl') as xls:
+        workbook['sheet_names'] = xls.sheet_names
+        logger.debug(f"Sheet names: {workbook['sheet_names']}")
+        if sales_sheet_name not in workbook['sheet_names']:
+            return workbook
+        check_sales_header(workbook, list(xls.parse(sales_sheet_name, nrows=0).columns))
+        if read_data and not workbook['missing_required']:
+            resolved = resolve_sales_columns(workbook['columns'])
+            workbook['df'] = xls.parse(sales_sheet_name, usecols=list(resolved),
+                                       dtype=sales_read_dtypes(resolved)).rename(columns=resolved)
+            logger.debug(f"Excel file read successfully: {file_path}, {len(workbook['df'])} rows")
+    return workbook
+
+def sales_report_format(file_path):
+    """Detect an uploaded report's format from its leading bytes: xlsx, parquet, feather, csv or None."""
+    with open(file_path, 'rb') as f:
+        magic = f.read(8)
+    if magic.startswith(b'PK\x03\x04'):
+        return 'xlsx'
+    if magic.startswith(b'PAR1'):
+        return 'parquet'
+    if magic.startswith(b'ARROW1'):
+        return 'feather'
+    if file_path.lower().endswith('.csv'):
+        return 'csv'
+    return None
+
+def iter_csv_batches(file_path, columns, batch_size):
+    """Yield the resolved columns of a CSV report in chunks of batch_size rows."""
+    resolved = resolve_sales_columns(columns)
+    start = 0
+    # Other text columns stay strings, so IDs and codes are not re-typed per chunk
+    with pd.read_csv(file_path, usecols=list(resolved), dtype=sales_read_dtypes(resolved, str), encoding='utf-8-sig',
+                     float_precision='round_trip', chunksize=batch_size) as reader:
+        for chunk in reader:
+            chunk = chunk.rename(columns=resolved)
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+
+def load_sales_report(file_path, read_data=False):
+    """Check the sales header of an xlsx, CSV, Parquet or Feather report and optionally read it.
+
+    Returns the same dict as load_sales_workbook plus its 'format'. Non-Excel reports
+    hold a single table, listed under the sales sheet name. Columnar formats read only
+    the columns that deconstruction uses.
+    """
+    fmt = sales_report_format(file_path)
+    logger.debug(f"Detected {fmt} report: {file_path}")
+    if fmt == 'xlsx':
+        return load_sales_workbook(file_path, read_data)
+    workbook = {'format': fmt, 'sheet_names': [], 'columns': None, 'missing_required': [], 'missing_optional': [], 'df': None}
+    if fmt is None:
+        return workbook
+    workbook['sheet_names'] = [sales_sheet_name]
+    if fmt == 'csv':
+        columns = list(pd.read_csv(file_path, nrows=0, encoding='utf-8-sig').columns)
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq  # Only needed for Parquet reports
+        columns = pq.read_schema(file_path).names
+    else:
+        import pyarrow as pa  # Only needed for Feather reports
+        with pa.memory_map(file_path) as source:
+            columns = pa.ipc.open_file(source).schema.names
+    check_sales_header(workbook, columns)
+    if read_data and not workbook['missing_required']:
+        resolved = resolve_sales_columns(columns)
+        if fmt == 'csv':
+            df = pd.concat(iter_csv_batches(file_path, columns, config['CSV_CHUNK_ROWS']))
+        else:
+            if fmt == 'parquet':
+                df = pd.read_parquet(file_path, columns=list(resolved))
+            else:
+                df = pd.read_feather(file_path, columns=list(resolved))
+            # Arrow nulls arrive as None in text columns; use NaN like the Excel and CSV readers
+            df = df.fillna(np.nan).astype(sales_read_dtypes(resolved)).rename(columns=resolved)
+        workbook['df'] = df
+        logger.debug(f"{fmt} report read successfully: {file_path}, {len(df)} rows")
+    return workbook
+
+# Sales columns in the order a row is read during deconstruction
+row_required_fields = ['Sales Price', 'Frame', 'Customer/Project: Company Name']
+row_attribute_fields = ['Process', '[ES] Step Process', 'Coating', 'Foil Material', 'Foil Thickness', 'Colour']
+
+def clean_text_column(series, default=None):
+    """Column-wise equivalent of str(value).strip(), with default for missing values."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Clean each category once; missing values (code -1) read as 'nan' like astype(str)
+        codes = series.cat.codes.to_numpy()
+        uniques = list(series.cat.categories.astype(str)) + ['nan']
+    else:
+        codes, uniques = pd.factorize(series.astype(str))
+    cleaned = np.array([value.strip() for value in uniques], dtype=object)[codes]
+    if default is not None:
+        cleaned[series.isna().to_numpy()] = default
+    return cleaned
+
+def parse_sales_prices(series):
+    """Convert Sales Price values with float(), returning (prices, per-row error or None)."""
+    errors = np.full(len(series), None, dtype=object)
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(dtype='float64', na_value=np.nan), errors
+    codes, uniques = pd.factorize(series)
+    unique_prices = np.full(len(uniques) + 1, np.nan)
+    unique_errors = np.full(len(uniques) + 1, None, dtype=object)
+    for i, value in enumerate(uniques):
+        try:
+            unique_prices[i] = float(value)
+        except (ValueError, TypeError):
+            unique_errors[i] = 'invalid'
+        except Exception as e:
+            unique_errors[i] = f"Error processing row: {str(e)}"
+    prices = unique_prices[codes]
+    errors = unique_errors[codes]
+    invalid = errors == 'invalid'
+    if invalid.any():
+        errors[invalid] = 'Invalid Sales Price: ' + series[invalid].astype(str).to_numpy(dtype=object)
+    return prices, errors
+
+def parse_pricing_rules(form):
+    """Build nested Process/Coating pricing rules from pricing form fields.
+
+    Returns (rules, non_zero_prices). Blank or invalid costs count as 0.
+    """
+    rules = {
+        "Process": {},
+        "Coating": {},
+        "Foil Material": {},
+        "Foil Thickness": {},
+        "Colour": {}
+    }
+    non_zero_prices = False
+    for process in process_step_mapping:
+        rules["Process"][process] = {}
+        for step in process_step_mapping[process]:
+            cost = form.get(f"{process}_{step}", "0")
+            try:
+                cost_value = float(cost) if cost.strip() else 0
+                # Apply 1-20 price (245) for LaserSTEP ranges >= 21-30 if not specified
+                if process == "LaserSTEP" and step in ["21-30", "31-40", "41-50", "51-60"] and cost_value == 0:
+                    cost_value = rules["Process"]["LaserSTEP"].get("1-20", 245)
+                    logger.debug("Applied default price for %s_%s: %s (from 1-20)", process, step, cost_value)
+                rules["Process"][process][step] = cost_value
+                if cost_value != 0:
+                    non_zero_prices = True
+                logger.debug("Set price for %s_%s: %s", process, step, cost_value)
+            except ValueError:
+                logger.warning("Invalid cost value for %s_%s: %s", process, step, cost)
+                rules["Process"][process][step] = 0
+    
+    for coating in coatings:
+        cost = form.get(f"Coating_{coating}", "0")
+        try:
+            cost_value = float(cost) if cost.strip() else 0
+            rules["Coating"][coating] = cost_value
+            if cost_value != 0:
+                non_zero_prices = True
+            logger.debug("Set price for Coating_%s: %s", coating, cost_value)
+        except ValueError:
+            logger.warning("Invalid cost value for Coating_%s: %s", coating, cost)
+            rules["Coating"][coating] = 0
+    
+    logger.debug("Final pricing rules: %s", rules)
+    return rules, non_zero_prices
+
+# A step count ("7") or step range ("21-30"), with optional spaces
+step_range_pattern = r'^\s*(\d+)\s*(?:-\s*(\d+))?\s*$'
+
+def parse_pricing_file(lines):
+    """Map the lines of an attributePricing.txt-style file ("chem single: 175") to pricing form fields."""
+    form_data = {}
+    for line in lines:
+        line = line.strip()
+        if ':' not in line:
+            continue
+        key, value = [part.strip() for part in line.split(':', 1)]
+        try:
+            value = float(value)
+        except ValueError:
+            logger.warning("Invalid price value in pricing file for %s: %s", key, value)
+            continue
+        
+        # Normalize key for comparison
+        key = key.lower().replace('lasterstep', 'laserstep').replace('laststep', 'laserstep')
+        
+        # Map keys to form_data
+        if key.startswith('chem '):
+            step = key[5:]  # Keep exact format (e.g., "5 or more")
+            if step == '5 or more' or step.title() in process_step_mapping["Chemetch"]:
+                form_data[f"Chemetch_{step if step == '5 or more' else step.title()}"] = str(value)
+                logger.debug("Set form_data[Chemetch_%s]: %s", step if step == '5 or more' else step.title(), value)
+        elif key.startswith('laserstep '):
+            step = key[10:]  # Keep exact format (e.g., "1-2")
+            if step in process_step_mapping["LaserSTEP"]:
+                form_data[f"LaserSTEP_{step}"] = str(value)
+                logger.debug("Set form_data[LaserSTEP_%s]: %s", step, value)
+            # Default to 1-20 price for new ranges if not specified
+            elif step in ["21-30", "31-40", "41-50", "51-60"]:
+                form_data[f"LaserSTEP_{step}"] = str(245)  # Use 1-20 price
+                logger.debug("Set form_data[LaserSTEP_%s]: 245 (default from 1-20)", step)
+        elif key.startswith('mill '):
+            step = key[5:].title()  # Convert to title case (e.g., "single" → "Single")
+            if step in process_step_mapping["Milled"]:
+                form_data[f"Milled_{step}"] = str(value)
+                logger.debug("Milled_%s: %s", step, value)
+        elif key == 'double':  # Handle ambiguous "double" (assume Milled_Double)
+            form_data["Milled_Double"] = str(value)
+            logger.warning("Ambiguous key 'double' mapped to Milled_Double: %s", value)
+        elif key.startswith('coat '):
+            coating = key[5:].title().replace('Bluprint', 'BluPrint')  # Handle title case and BluPrint
+            if coating in ["Advanced Nano", "Nano Wipe", "Nano Slic", "BluPrint"]:
+                form_data[f"Coating_{coating}"] = str(value)
+                logger.debug("Set form_data[Coating_%s]: %s", coating, value)
+    return form_data
+
+@dataclass(frozen=True)
+class RuleSet:
+    """Read-only pricing rules compiled into flat lookup tables.
+
+    Built once per request, so concurrent requests never share or mutate rule state.
+    Costs sit in flat arrays aligned with pair_index and coating_index, so a column of
+    values resolves with one get_indexer call instead of a dict probe per value.
+    """
+    process_costs: MappingProxyType  # (process, step) -> cost
+    coating_costs: MappingProxyType  # coating -> cost
+    processes: frozenset  # processes that have rules, even with no steps
+    # Cost arrays end with a 0/False entry that answers get_indexer's -1 (not found)
+    pair_index: pd.MultiIndex = field(compare=False)  # (process, step) pairs, aligned with pair_costs
+    pair_costs: np.ndarray = field(compare=False)
+    pair_is_float: np.ndarray = field(compare=False)
+    coating_index: pd.Index = field(compare=False)  # coatings, aligned with coating_cost_array
+    coating_cost_array: np.ndarray = field(compare=False)
+    coating_is_float: np.ndarray = field(compare=False)
+    step_tiers: MappingProxyType = field(compare=False)  # process -> (tier lower bounds, upper bounds, pair positions)
+
+    def __reduce__(self):
+        # Mapping proxies cannot be pickled, so rebuild from plain dicts (e.g. in worker processes)
+        return (make_rule_set, (dict(self.process_costs), dict(self.coating_costs), self.processes))
+
+    def process_cost_table(self, processes, steps):
+        """Look up aligned arrays of processes and steps, returning (costs, found, is_float).
+
+        Pairs are matched by name first. Steps of a tiered process that match no tier by
+        name are parsed as step counts or ranges and placed in the tier covering their
+        upper count, with one binary search over all of them. A count in a gap between
+        tiers, or outside them, stays unmatched.
+        """
+        positions = self.pair_index.get_indexer(pd.MultiIndex.from_arrays([processes, steps]))
+        for process, (lowers, uppers, tier_positions) in self.step_tiers.items():
+            pending = (positions < 0) & (processes == process)
+            if not pending.any():
+                continue
+            bounds = pd.Series(steps[pending], dtype=object).astype(str).str.extract(step_range_pattern)
+            lower = pd.to_numeric(bounds[0]).to_numpy(dtype='float64')
+            upper = pd.to_numeric(bounds[1]).to_numpy(dtype='float64')
+            upper = np.where(np.isnan(upper), lower, upper)  # A single count is its own upper bound
+            tiers = np.searchsorted(uppers, upper)  # NaN sorts last, so unparsed steps fall out of range
+            in_range = (lower >= lowers.min()) & (lower <= upper) & (tiers < len(uppers))
+            in_range[in_range] &= upper[in_range] >= lowers[tiers[in_range]]
+            resolved = positions[pending]
+            resolved[in_range] = tier_positions[tiers[in_range]]
+            positions[pending] = resolved
+            logger.debug("Resolved %d %s step values by tier", in_range.sum(), process)
+        return self.pair_costs[positions], positions >= 0, self.pair_is_float[positions]
+
+    def coating_cost_table(self, coatings):
+        """Look up an array of coatings, returning (costs, found, is_float)."""
+        positions = self.coating_index.get_indexer(coatings)
+        return self.coating_cost_array[positions], positions >= 0, self.coating_is_float[positions]
+
+def make_rule_set(process_costs, coating_costs, processes):
+    """Wrap flat cost tables in a RuleSet, compiling their lookup arrays and step tiers.
+
+    A process whose steps are all counts or ranges ("1-2" ... "51-60") is tiered: a
+    count resolves to the tier with the smallest upper bound at or above it, and only
+    if it is not below that tier's own lower bound, so counts in a gap between tiers
+    stay unpriced (see RuleSet.process_cost_table).
+    """
+    process_costs = dict(process_costs)
+    coating_costs = dict(coating_costs)
+    pairs = list(process_costs)
+    pair_index = pd.MultiIndex.from_arrays([[process for process, _ in pairs], [step for _, step in pairs]])
+    step_tiers = {}
+    for process in processes:
+        positions = [i for i, (proc, _) in enumerate(pairs) if proc == process]
+        bounds = [re.match(step_range_pattern, str(pairs[i][1])) for i in positions]
+        if not positions or not all(bounds):
+            continue
+        lowers = [int(match.group(1)) for match in bounds]
+        uppers = [int(match.group(2) or match.group(1)) for match in bounds]
+        order = np.argsort(uppers, kind='stable')
+        step_tiers[process] = (np.array(lowers)[order], np.array(uppers)[order], np.array(positions)[order])
+    return RuleSet(
+        MappingProxyType(process_costs), MappingProxyType(coating_costs), frozenset(processes),
+        pair_index,
+        np.array([process_costs[pair] for pair in pairs] + [0], dtype='float64'),
+        np.array([isinstance(process_costs[pair], float) for pair in pairs] + [False], dtype=bool),
+        pd.Index(list(coating_costs), dtype=object),
+        np.array(list(coating_costs.values()) + [0], dtype='float64'),
+        np.array([isinstance(cost, float) for cost in coating_costs.values()] + [False], dtype=bool),
+        MappingProxyType(step_tiers)
+    )
+
+def compile_pricing_rules(rules):
+    """Compile nested Process/Coating pricing rules into a RuleSet."""
+    process_costs = {(process, step): cost for process, steps in rules["Process"].items() for step, cost in steps.items()}
+    return make_rule_set(process_costs, rules["Coating"], rules["Process"])
+
+# Cleaned sales columns, before and after pricing rules are applied
+sales_columns = ['Customer', 'Customer_Internal_ID', 'Frame', 'Item_Internal_ID', 'Sales_Price',
+                 'Process', 'Step_Process', 'Coating', 'Foil_Material', 'Foil_Thickness', 'Colour']
+result_columns = sales_columns + ['Attribute_Cost', 'Base_Cost']
+# Attribute_Cost split by rule, kept with stored results so a rule change can re-price them in place
+cost_component_columns = ['Process_Cost', 'Coating_Cost']
+# Low-cardinality columns, held as categoricals (sorted categories) rather than repeated strings
+compact_columns = ['Customer', 'Process', 'Step_Process', 'Coating', 'Foil_Material', 'Foil_Thickness', 'Colour']
+# Rows repeating all of these are reported once
+dedup_columns = ['Customer', 'Process', 'Step_Process', 'Coating', 'Foil_Material', 'Foil_Thickness', 'Colour', 'Sales_Price']
+
+def normalize_sales_data(df):
+    """Clean and validate sales rows using whole-column operations, independent of pricing rules.
+
+    Returns (sales_df, skipped_rows) with the same rows, values and skip reasons as
+    walking the sheet row by row, but with string cleaning done once per distinct
+    value instead of once per row.
+    """
+    reasons = np.full(len(df), None, dtype=object)
+
+    # A column absent under its exact name fails every row that reaches it
+    absent = next((col for col in row_required_fields + row_attribute_fields if col not in df.columns), None)
+    if absent in row_required_fields:
+        reasons[:] = f"Error processing row: {str(KeyError(absent))}"
+    else:
+        missing = np.zeros((len(df), len(row_required_fields)), dtype=bool)
+        for i, col in enumerate(row_required_fields):
+            missing[:, i] = df[col].isna().to_numpy()
+        has_missing = missing.any(axis=1)
+        for pattern in np.unique(missing[has_missing], axis=0):
+            names = ', '.join(col for col, flag in zip(row_required_fields, pattern) if flag)
+            reasons[has_missing & (missing == pattern).all(axis=1)] = f"Missing required fields: {names}"
+        if absent:
+            reasons[~has_missing] = f"Error processing row: {str(KeyError(absent))}"
+        else:
+            prices, price_errors = parse_sales_prices(df['Sales Price'])
+            price_failed = ~has_missing & (price_errors != None)  # noqa: E711
+            reasons[price_failed] = price_errors[price_failed]
+
+    skipped_mask = reasons != None  # noqa: E711
+    skipped_rows = list(zip(df.index[skipped_mask].tolist(), reasons[skipped_mask].tolist()))
+    if skipped_mask.all():
+        return pd.DataFrame(columns=sales_columns), skipped_rows
+
+    rows = df[~skipped_mask]
+    process = clean_text_column(rows['Process'], 'Unknown')
+    step_process = clean_text_column(rows['[ES] Step Process'], 'None')
+    is_laserstep = process == 'LaserSTEP'
+    if is_laserstep.any():
+        step_process[is_laserstep] = pd.Series(step_process[is_laserstep]).str.replace(r'\s*-\s*', '-', regex=True).to_numpy(dtype=object)
+
+    sales_df = pd.DataFrame({
+        'Customer': pd.Categorical(clean_text_column(rows['Customer/Project: Company Name'], 'Unknown')),
+        'Customer_Internal_ID': clean_text_column(rows['Customer/Project: Internal ID'])
+        if 'Customer/Project: Internal ID' in rows.columns else 'Unknown',
+        'Frame': clean_text_column(rows['Frame']),
+        'Item_Internal_ID': clean_text_column(rows['Item: Internal ID'])
+        if 'Item: Internal ID' in rows.columns else 'Unknown',
+        'Sales_Price': prices[~skipped_mask],
+        'Process': pd.Categorical(process),
+        'Step_Process': pd.Categorical(step_process),
+        'Coating': pd.Categorical(clean_text_column(rows['Coating'], 'None')),
+        'Foil_Material': pd.Categorical(clean_text_column(rows['Foil Material'], 'Unknown')),
+        'Foil_Thickness': pd.Categorical(clean_text_column(rows['Foil Thickness'], 'Unknown')),
+        'Colour': pd.Categorical(clean_text_column(rows['Colour'], 'Unknown'))
+    }, columns=sales_columns)
+    logger.debug(f"Normalized {len(sales_df)} rows, skipped {len(skipped_rows)}")
+    return sales_df, skipped_rows
+
+def lookup_cost_components(sales_df, rule_set):
+    """Resolve each row's process and coating cost, looking up every distinct (process, step) pair and coating once.
+
+    Returns (process_cost, coating_cost, has_float_cost, lookups). Costs are 0 where no
+    rule applies and on LaserCut rows; has_float_cost marks rows that picked up a float
+    price. lookups holds the encoded pairs and coatings with their cost tables, for
+    reporting unpriced rows.
+    """
+    # Encode (process, step) pairs and coatings, resolve each distinct code once, then broadcast to rows
+    process_codes, process_values = pd.factorize(sales_df['Process'])
+    step_codes, step_values = pd.factorize(sales_df['Step_Process'])
+    pair_codes, pair_keys = pd.factorize(process_codes * len(step_values) + step_codes)
+    pair_process = np.asarray(process_values, dtype=object)[pair_keys // len(step_values)]
+    pair_step = np.asarray(step_values, dtype=object)[pair_keys % len(step_values)]
+    coating_codes, coating_values = pd.factorize(sales_df['Coating'])
+    coating_values = np.asarray(coating_values, dtype=object)
+    priced = (np.asarray(process_values, dtype=object) != 'LaserCut')[process_codes]
+
+    has_float_cost = np.zeros(len(sales_df), dtype=bool)
+    pair_table = rule_set.process_cost_table(pair_process, pair_step)
+    coating_table = rule_set.coating_cost_table(coating_values)
+    components = []
+    for codes, (costs, found, is_float) in ((pair_codes, pair_table), (coating_codes, coating_table)):
+        row_found = found[codes] & priced
+        components.append(np.where(row_found, costs[codes], 0.0))
+        has_float_cost |= row_found & is_float[codes]
+    lookups = {'priced': priced, 'pair_codes': pair_codes, 'pair_process': pair_process, 'pair_step': pair_step,
+               'pair_table': pair_table, 'coating_codes': coating_codes, 'coating_values': coating_values,
+               'coating_table': coating_table}
+    return components[0], components[1], has_float_cost, lookups
+
+def set_cost_columns(result_df, process_cost, coating_cost, has_float_cost):
+    """Store cost components with Attribute_Cost and Base_Cost; integer-only prices keep integer cost columns."""
+    attribute_cost = process_cost + coating_cost
+    result_df['Attribute_Cost'] = attribute_cost
+    result_df['Base_Cost'] = result_df['Sales_Price'].to_numpy(dtype='float64') - attribute_cost
+    result_df['Process_Cost'] = process_cost
+    result_df['Coating_Cost'] = coating_cost
+    if not has_float_cost.any():
+        # Rows that never picked up a float price keep the integer 0 they started with
+        result_df[['Attribute_Cost'] + cost_component_columns] = result_df[['Attribute_Cost'] + cost_component_columns].astype('int64')
+    return result_df
+
+def apply_pricing_rules(sales_df, rule_set, row_counts=None):
+    """Add Attribute_Cost and Base_Cost columns, and their Process_Cost and Coating_Cost components, using a RuleSet.
+
+    row_counts gives how many report rows each row stands for (streamed reports are
+    already deduplicated), so unpriced-row warnings count report rows either way.
+    """
+    if sales_df.empty:
+        return pd.DataFrame(columns=result_columns + cost_component_columns)
+    process_cost, coating_cost, has_float_cost, lookups = lookup_cost_components(sales_df, rule_set)
+    priced, pair_codes, coating_codes = lookups['priced'], lookups['pair_codes'], lookups['coating_codes']
+    pair_process, pair_step, coating_values = lookups['pair_process'], lookups['pair_step'], lookups['coating_values']
+    pair_table, coating_table = lookups['pair_table'], lookups['coating_table']
+
+    # One warning per unpriced attribute value for the whole run, instead of one per row or per batch
+    unpriced = collections.Counter()
+    row_counts = np.ones(len(sales_df), dtype='int64') if row_counts is None else np.asarray(row_counts, dtype='int64')
+    pair_rows = np.bincount(pair_codes, weights=row_counts, minlength=len(pair_process))
+    for i in np.flatnonzero(~pair_table[1] & (pair_process != 'LaserCut')):
+        proc, step = pair_process[i], pair_step[i]
+        unpriced[f"unknown step '{step}' for process '{proc}'" if proc in rule_set.processes else f"unknown process '{proc}'"] += int(pair_rows[i])
+    coating_rows = np.bincount(coating_codes[priced], weights=row_counts[priced], minlength=len(coating_values))
+    for i in np.flatnonzero(~coating_table[1] & (coating_rows > 0)):
+        unpriced[f"unknown coating '{coating_values[i]}'"] += int(coating_rows[i])
+    for reason, count in unpriced.most_common():
+        logger.warning(f"{count:,} of {row_counts.sum():,} rows with {reason}")
+
+    result_df = set_cost_columns(sales_df.reset_index(drop=True), process_cost, coating_cost, has_float_cost)
+    if config['TRACE_ROWS']:
+        # Seeded, so rerunning a report traces the same rows
+        sample = np.sort(np.random.default_rng(0).choice(len(result_df), min(config['TRACE_ROWS'], len(result_df)), replace=False))
+        tables = (pair_table, pair_codes[sample]), (coating_table, coating_codes[sample])
+        row_costs = [np.where(found[codes] & priced[sample], costs[codes].astype(object), 'no rule') for (costs, found, _), codes in tables]
+        trace_pricing_rows(result_df.iloc[sample], *row_costs)
+    return result_df
+
+def diff_rule_sets(old_rule_set, new_rule_set):
+    """Return (processes, coatings) whose costs differ between two RuleSets.
+
+    A process is listed when any of its step costs was added, removed or changed, since
+    its steps are resolved (and tiered) together. A cost changing between int and float
+    counts as a change, as it decides the cost columns' type.
+    """
+    def process_rules(rule_set, process):
+        return {step: (cost, type(cost)) for (proc, step), cost in rule_set.process_costs.items() if proc == process}
+    def coating_rule(rule_set, coating):
+        cost = rule_set.coating_costs.get(coating)
+        return cost, type(cost)
+    processes = {process for process, _ in list(old_rule_set.process_costs) + list(new_rule_set.process_costs)
+                 if process_rules(old_rule_set, process) != process_rules(new_rule_set, process)}
+    coatings = {coating for coating in set(old_rule_set.coating_costs) | set(new_rule_set.coating_costs)
+                if coating_rule(old_rule_set, coating) != coating_rule(new_rule_set, coating)}
+    return processes, coatings
+
+def reprice_results(result_df, old_rule_set, new_rule_set):
+    """Re-price results priced with old_rule_set for new_rule_set, rewriting only the rows the rule change affects.
+
+    result_df must carry the Process_Cost and Coating_Cost columns apply_pricing_rules
+    adds. Returns (result_df, changed), where changed marks the rows whose costs changed.
+    The rows themselves, and so deduplication, do not depend on the rules.
+    """
+    processes, coatings = diff_rule_sets(old_rule_set, new_rule_set)
+    affected = result_df['Process'].isin(processes).to_numpy() | result_df['Coating'].isin(coatings).to_numpy()
+    logger.debug("Rule change touches processes %s and coatings %s: %d of %d rows", sorted(processes), sorted(coatings),
+                 affected.sum(), len(result_df))
+    result_df = result_df.copy()
+    if not affected.any():
+        return result_df, affected
+    process_cost = result_df['Process_Cost'].to_numpy(dtype='float64')
+    coating_cost = result_df['Coating_Cost'].to_numpy(dtype='float64')
+    # Lookups go by distinct values, so resolving every row only to learn the column type is cheap
+    new_process_cost, new_coating_cost, has_float_cost, _ = lookup_cost_components(result_df, new_rule_set)
+    changed = affected & ((new_process_cost != process_cost) | (new_coating_cost != coating_cost))
+    process_cost[changed] = new_process_cost[changed]
+    coating_cost[changed] = new_coating_cost[changed]
+    return set_cost_columns(result_df, process_cost, coating_cost, has_float_cost), changed
+
+def trace_pricing_rows(rows, process_costs, coating_costs):
+    """Log how each of a sample of priced rows got its costs."""
+    for (i, row), process_cost, coating_cost in zip(rows.iterrows(), process_costs, coating_costs):
+        trace_logger.info("Row %d: customer=%s process=%s step=%s coating=%s sales_price=%s process_cost=%s "
+                          "coating_cost=%s attribute_cost=%s base_cost=%s", i, row['Customer'], row['Process'],
+                          row['Step_Process'], row['Coating'], row['Sales_Price'], process_cost, coating_cost,
+                          row['Attribute_Cost'], row['Base_Cost'])
+
+def deconstruct_sales_data(df, rule_set):
+    """Deconstruct sales rows into attribute and base costs. Returns (result_df, skipped_rows)."""
+    sales_df, skipped_rows = normalize_sales_data(df)
+    return apply_pricing_rules(sales_df, rule_set), skipped_rows
+
+def convert_excel_value(value):
+    """Convert a raw openpyxl cell value the way pandas' openpyxl reader does."""
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        number = int(value)
+        return number if number == value else float(value)
+    return value
+
+def iter_sales_batches(file_path, batch_size):
+    """Yield the sales sheet as DataFrames of up to batch_size rows, streamed in read-only mode.
+
+    Only the resolved sales columns are converted, under their canonical names. Cells
+    go through the same conversion and NA handling as pd.read_excel, and rows keep
+    their sheet position as index. Numeric column dtypes are pinned from the first
+    batch, so a later batch with gaps renders its numbers the same way.
+    """
+    import openpyxl  # Loaded on first use so the command line tool starts quickly
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = wb[sales_sheet_name]
+        sheet.reset_dimensions()  # Stored dimensions can be wrong; read until the last row
+        rows = sheet.iter_rows(values_only=True)
+        raw_header = [convert_excel_value(value) for value in next(rows, ())]
+        resolved = resolve_sales_columns(raw_header)
+        header = list(resolved.values())
+        positions = [raw_header.index(col) for col in resolved]
+        batch, blank_rows, start, dtypes = [], [], 0, None
+        for row in rows:
+            # Blank rows are judged on every column, as read_excel does before projecting
+            values = [convert_excel_value(row[i]) if i < len(row) else '' for i in positions]
+            if all(value is None or value == '' for value in row):
+                blank_rows.append(values)  # Only kept if data follows, as read_excel trims trailing blanks
+                continue
+            batch += blank_rows + [values]
+            blank_rows = []
+            if len(batch) >= batch_size:
+                frame, dtypes = build_sales_batch(header, batch, start, dtypes)
+                yield frame
+                start += len(batch)
+                batch = []
+        if batch or start == 0:
+            yield build_sales_batch(header, batch, start, dtypes)[0]
+    finally:
+        wb.close()
+
+def build_sales_batch(header, rows, start, dtypes):
+    """Parse one batch of converted rows into a DataFrame, returning it with the pinned dtypes."""
+    frame = TextParser([header] + rows, header=0, skip_blank_lines=False).read()
+    frame = frame.astype(sales_read_dtypes({col: col for col in header}))
+    frame.index = pd.RangeIndex(start, start + len(frame))
+    if dtypes is None:
+        return frame, frame.dtypes.to_dict()
+    for col, dtype in dtypes.items():
+        if col in categorical_columns or frame[col].dtype == dtype:
+            continue
+        if dtype == 'float64' and pd.api.types.is_numeric_dtype(frame[col].dtype):
+            frame[col] = frame[col].astype('float64')
+        elif dtype == 'int64' and frame[col].dtype == 'float64':
+            # Gaps turned whole numbers into floats; keep them whole as in earlier batches
+            whole = frame[col].notna() & (frame[col] % 1 == 0)
+            frame[col] = frame[col].astype(object)
+            frame.loc[whole, col] = frame.loc[whole, col].astype('int64')
+    return frame, dtypes
+
+def dedup_keys(df, columns=dedup_columns):
+    """Hash each row's columns into one 64-bit key, equal wherever drop_duplicates sees equal rows."""
+    key_df = df[columns]
+    floats = key_df.select_dtypes('float').columns
+    if len(floats):
+        # -0.0 compares equal to 0.0 but hashes differently
+        key_df = key_df.assign(**{col: key_df[col] + 0.0 for col in floats})
+    return pd.util.hash_pandas_object(key_df, index=False).to_numpy()
+
+class RowDeduplicator:
+    """Keep the first row of each dedup_columns combination across batches, counting every occurrence.
+
+    Rows are compared by one hashed key each (categoricals hash per category, not per
+    row), and state holds one key and count per distinct combination, so cost grows
+    with unique combinations rather than rows seen.
+    """
+
+    def __init__(self, columns=dedup_columns):
+        self.columns = columns
+        self.keys = np.empty(0, dtype='uint64')
+        self.counts = np.empty(0, dtype='int64')
+        self.key_index = pd.Index(self.keys)
+        self.rows_seen = 0
+
+    def add(self, df):
+        """Count the rows of df and return those whose combination has not been seen before."""
+        self.rows_seen += len(df)
+        if df.empty:
+            return df
+        codes, uniques = pd.factorize(dedup_keys(df, self.columns))
+        # Codes are numbered in order of first appearance, so a row is first when its code is a new maximum
+        is_first = np.empty(len(codes), dtype=bool)
+        is_first[0] = True
+        is_first[1:] = codes[1:] > np.maximum.accumulate(codes)[:-1]
+        counts = np.bincount(codes, minlength=len(uniques))
+        positions = self.key_index.get_indexer(uniques)
+        known = positions >= 0
+        self.counts[positions[known]] += counts[known]
+        self.keys = np.concatenate([self.keys, uniques[~known]])
+        self.counts = np.concatenate([self.counts, counts[~known]])
+        self.key_index = pd.Index(self.keys)
+        return df.iloc[np.flatnonzero(is_first)[~known]]
+
+    @property
+    def duplicates(self):
+        """Rows seen beyond the first of their combination."""
+        return self.rows_seen - len(self.keys)
+
+    def counts_for(self, df):
+        """Occurrences seen so far of each row's combination (0 if never added)."""
+        positions = self.key_index.get_indexer(dedup_keys(df, self.columns))
+        return np.where(positions >= 0, self.counts[positions], 0)
+
+    def restore(self, df, counts, rows_seen):
+        """Pick up from a saved run: df holds the first row of each combination and counts its counts_for."""
+        self.keys = dedup_keys(df, self.columns)
+        self.counts = np.asarray(counts, dtype='int64')
+        self.key_index = pd.Index(self.keys)
+        self.rows_seen = rows_seen
+
+def stream_sales_data(batches, deduplicator=None):
+    """Normalize and deduplicate sales report batches one at a time with bounded memory.
+
+    Returns (sales_df, skipped_rows) where sales_df holds only the first row of each
+    dedup_columns combination. Pricing never adds or drops rows, so deduplicating
+    before pricing keeps the same rows as deduplicating the priced results. Pass a
+    RowDeduplicator to read the duplicate counts afterwards.
+    """
+    frames, skipped_rows = [], []
+    deduplicator = deduplicator or RowDeduplicator()
+    total_rows = 0
+    for batch in batches:
+        sales_df, batch_skipped = normalize_sales_data(batch)
+        skipped_rows += batch_skipped
+        total_rows += len(batch)
+        sales_df = deduplicator.add(sales_df)
+        if len(sales_df):
+            frames.append(sales_df)
+        logger.debug("Streamed %d rows, %d unique so far", total_rows, len(deduplicator.keys))
+    if not frames:
+        return pd.DataFrame(columns=sales_columns), skipped_rows
+    # Batches carry their own categories, so re-encode once over the combined rows
+    sales_df = pd.concat(frames, ignore_index=True).astype(dict.fromkeys(compact_columns, 'category'))
+    return sales_df, skipped_rows
+
+def write_results_excel(result_df, excel_path):
+    """Write results to xlsx, streaming rows in write-only mode for large results."""
+    if len(result_df) < config['FAST_XLSX_MIN_ROWS']:
+        result_df.to_excel(excel_path, index=False, engine='openpyxl')
+        return
+    import openpyxl  # Loaded on first use so the command line tool starts quickly
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    header = []
+    for col in result_df.columns:
+        cell = WriteOnlyCell(ws, value=col)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    ws.append(header)
+    # Match to_excel: missing values become blank cells and infinities are written as text
+    values = result_df.astype(object).where(result_df.notna(), None)
+    for col in result_df.select_dtypes('float').columns:
+        values.loc[np.isinf(result_df[col]), col] = np.where(result_df[col] > 0, 'inf', '-inf')[np.isinf(result_df[col])]
+    for row in values.itertuples(index=False, name=None):
+        ws.append(row)
+    wb.save(excel_path)
+
+def write_results_file(result_df, path, fmt):
+    """Write results as csv, xlsx or parquet, leaving out the stored cost components."""
+    result_df = result_df.drop(columns=cost_component_columns, errors='ignore')
+    if fmt == 'csv':
+        result_df.to_csv(path, index=False)
+    elif fmt == 'xlsx':
+        write_results_excel(result_df, path)
+    else:
+        result_df.to_parquet(path, index=False)
+
+class PricingError(Exception):
+    """A pricing run failed; the message is an HTML error fragment for the user."""
+
+def parse_sales_report(file_path, deduplicator):
+    """Validate, parse and normalize a sales report in any supported format.
+
+    Returns (sales_df, skipped_rows, column_warning). Streamed reports (CSV and very
+    large workbooks) are deduplicated into deduplicator as they are read. Raises
+    PricingError when the report cannot be read.
+    """
+    if not os.path.exists(file_path):
+        logger.error(f"File does not exist on disk: {file_path}")
+        raise PricingError(f'<p class="error">Uploaded Excel file not found on disk: {os.path.basename(file_path)}. It may have been deleted, moved, or not saved properly. Please upload again.</p>')
+    logger.debug(f"Validating file before processing: {file_path}")
+    # Check file permissions
+    if not os.access(file_path, os.R_OK):
+        logger.error(f"No read permissions for file: {file_path}")
+        raise PricingError(f'<p class="error">No read permissions for file: {os.path.basename(file_path)}. Please check file permissions and upload again.</p>')
+    
+    # CSV reports and very large workbooks are streamed in batches instead of read whole
+    fmt = sales_report_format(file_path)
+    streaming = fmt == 'csv' or (fmt == 'xlsx' and os.path.getsize(file_path) >= config['STREAMING_MIN_BYTES'])
+    workbook = load_sales_report(file_path, read_data=not streaming)
+    sheet_names = workbook['sheet_names']
+    if workbook['columns'] is None:
+        logger.error(f"Sheet 'SalesbyItemBASEPRICEDECON' not found in {file_path}")
+        raise PricingError(f'<p class="error">Sheet "SalesbyItemBASEPRICEDECON" not found in {os.path.basename(file_path)}. Available sheets: {", ".join(sheet_names)}</p>')
+    
+    df = workbook['df']
+    columns = workbook['columns']
+    missing_required_columns = workbook['missing_required']
+    missing_optional_columns = workbook['missing_optional']
+    if missing_required_columns:
+        logger.error(f"Missing required columns in Excel file: {missing_required_columns}")
+        raise PricingError(f'<p class="error">Missing required columns in {os.path.basename(file_path)}: {", ".join(missing_required_columns)}. Found: {", ".join(str(col) for col in columns)}</p>')
+    if missing_optional_columns:
+        logger.warning(f"Missing optional columns in Excel file: {missing_optional_columns}. Proceeding with warning.")
+        column_warning = f"Missing optional columns in {os.path.basename(file_path)}: {', '.join(missing_optional_columns)}. Found: {', '.join(str(col) for col in columns)}"
+    else:
+        column_warning = None
+        logger.debug("Excel file validated successfully")
+    
+    if fmt == 'csv':
+        sales_df, skipped_rows = stream_sales_data(iter_csv_batches(file_path, columns, config['CSV_CHUNK_ROWS']), deduplicator)
+    elif streaming:
+        sales_df, skipped_rows = stream_sales_data(iter_sales_batches(file_path, config['STREAMING_BATCH_ROWS']), deduplicator)
+    else:
+        sales_df, skipped_rows = normalize_sales_data(df)
+    return sales_df, skipped_rows, column_warning
+
+def price_sales_data(sales_df, skipped_rows, rule_set, file_path, deduplicator=None):
+    """Apply a RuleSet to normalized rows. Raises PricingError, listing skip reasons, when no row is priced.
+
+    Pass the deduplicator a streamed report was read with (or restored for a cached parse of one), so logged
+    row counts cover every report row.
+    """
+    row_counts = deduplicator.counts_for(sales_df) if deduplicator is not None and deduplicator.rows_seen else None
+    result_df = apply_pricing_rules(sales_df, rule_set, row_counts)
+    reasons = collections.Counter(reason for _, reason in skipped_rows)
+    for reason, count in reasons.most_common(5):
+        logger.info(f"{count:,} rows skipped: {reason}")
+    if len(reasons) > 5:
+        logger.info(f"{sum(count for _, count in reasons.most_common()[5:]):,} rows skipped for {len(reasons) - 5} other reasons")
+    
+    if result_df.empty:
+        logger.error(f"No valid data processed from Excel file. Skipped {len(skipped_rows)} rows.")
+        error_message = f'<p class="error">No valid data found in Excel file {os.path.basename(file_path)}. Reasons for skipping rows:<br>'
+        error_message += '<ul>' + ''.join(f'<li>Row {row_idx}: {reason}</li>' for row_idx, reason in skipped_rows[:10]) + '</ul>'
+        if len(skipped_rows) > 10:
+            error_message += f'<p>And {len(skipped_rows) - 10} more rows skipped. Check the debug log for details.</p>'
+        error_message += '<p>Please check the file contents (e.g., ensure Sales Price, Frame, and Customer/Project: Company Name are populated).</p>'
+        raise PricingError(error_message)
+    return result_df
+
+def deduplicate_results(result_df, deduplicator, file_path):
+    """Keep one row per customer, material and sales price combination, logging the most repeated ones."""
+    try:
+        logger.debug(f"Processed {len(result_df)} rows before duplicate removal")
+        # Ensure Customer and Sales_Price are valid
+        if 'Customer' not in result_df.columns or 'Sales_Price' not in result_df.columns:
+            logger.error(f"Missing critical columns in DataFrame: {result_df.columns}")
+            raise PricingError(f'<p class="error">Missing critical columns in {os.path.basename(file_path)}: {", ".join(result_df.columns)}</p>')
+        # Handle non-string IDs or non-numeric Sales_Price; Customer is already a cleaned categorical
+        result_df['Customer_Internal_ID'] = result_df['Customer_Internal_ID'].astype(str)
+        result_df['Item_Internal_ID'] = result_df['Item_Internal_ID'].astype(str)
+        result_df['Sales_Price'] = pd.to_numeric(result_df['Sales_Price'], errors='coerce')
+        result_df['Base_Cost'] = pd.to_numeric(result_df['Base_Cost'], errors='coerce')
+        if result_df['Sales_Price'].isna().all():
+            logger.error("All Sales_Price values are invalid")
+            raise PricingError(f'<p class="error">All Sales_Price values are invalid in {os.path.basename(file_path)}. Please check Sales Price data.</p>')
+        # Remove exact duplicates based on customer, material attributes, and sales price
+        if not deduplicator.rows_seen:  # Streamed reports were deduplicated as they were read
+            result_df = deduplicator.add(result_df)
+        result_df = result_df.reset_index(drop=True)
+        logger.debug(f"After duplicate removal: {len(result_df)} unique customer-material-price combinations")
+        if deduplicator.duplicates and logger.isEnabledFor(logging.DEBUG):
+            counts = deduplicator.counts_for(result_df)
+            for i in np.argsort(-counts, kind='stable')[:5]:
+                if counts[i] > 1:
+                    logger.debug("Duplicate combination seen %d times: %s", counts[i],
+                                 ' / '.join(str(result_df.at[i, col]) for col in dedup_columns))
+    except PricingError:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing results: {str(e)}")
+        raise PricingError(f'<p class="error">Error processing results from {os.path.basename(file_path)}: {str(e)}. Please try again.</p>')
+    return result_df
+
+def deconstruct_report(file_path, rules, output_path, fmt='parquet'):
+    """Price one report and write its results to output_path. Batch runs call this in pool workers.
+
+    Returns (summary, result_df): summary holds file, rows, duplicates, skipped,
+    column_warning and error; result_df is None when error is set.
+    """
+    summary = {'file': os.path.basename(file_path), 'rows': 0, 'duplicates': 0, 'skipped': 0,
+               'column_warning': None, 'error': None}
+    try:
+        deduplicator = RowDeduplicator()
+        sales_df, skipped_rows, summary['column_warning'] = parse_sales_report(file_path, deduplicator)
+        result_df = price_sales_data(sales_df, skipped_rows, compile_pricing_rules(rules), file_path, deduplicator)
+        result_df = deduplicate_results(result_df, deduplicator, file_path)
+        write_results_file(result_df, output_path, fmt)
+    except PricingError as e:
+        summary['error'] = str(e)
+        return summary, None
+    except Exception as e:
+        logger.error(f"Error processing {file_path} in batch: {str(e)}")
+        summary['error'] = f'<p class="error">Error reading {os.path.basename(file_path)}: {str(e)}.</p>'
+        return summary, None
+    summary.update(rows=len(result_df), duplicates=deduplicator.duplicates, skipped=len(skipped_rows))
+    logger.debug(f"Batch report {file_path}: {len(result_df)} rows")
+    return summary, result_df
+
+def run_batch(file_paths, rules, output_paths, fmt='parquet', names=None):
+    """Deconstruct many reports against one set of rules on a process pool, one report per worker.
+
+    Returns (summaries, combined_df): combined_df stacks every priced report under a
+    Report column holding its name (default: file name), or is None if no report
+    could be priced. With names, summaries and their messages use them too.
+    """
+    workers = max(1, min(len(file_paths), config['BATCH_WORKERS']))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(pool.map(deconstruct_report, file_paths, [rules] * len(file_paths), output_paths, [fmt] * len(file_paths)))
+    summaries = [summary for summary, _ in outcomes]
+    for summary, file_path, name in zip(summaries, file_paths, names or []):
+        # Messages name the file a worker read; report them under the name the user knows
+        stored_name = os.path.basename(file_path)
+        summary['file'] = name
+        if summary['error']:
+            summary['error'] = summary['error'].replace(stored_name, html.escape(name))
+        if summary['column_warning']:
+            summary['column_warning'] = summary['column_warning'].replace(stored_name, name)
+    frames = [result_df.assign(Report=summary['file']) for summary, result_df in outcomes if result_df is not None]
+    if not frames:
+        return summaries, None
+    combined_df = pd.concat(frames, ignore_index=True)
+    combined_df = combined_df[['Report'] + [col for col in combined_df.columns if col != 'Report']]
+    return summaries, combined_df.astype(dict.fromkeys(compact_columns + ['Report'], 'category'))
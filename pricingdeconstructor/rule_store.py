@@ -0,0 +1,71 @@
+"""Saved pricing rule sets: named, immutable versions stored in SQLite."""
+import os
+import logging
+import json
+import time
+import functools
+import sqlite3
+from contextlib import closing
+
+from .engine import compile_pricing_rules, parse_pricing_file, parse_pricing_rules
+
+logger = logging.getLogger(__name__)
+
+# Rule set database used when no other path is given
+default_rules_db = os.environ.get('RULES_DB', os.path.join('Uploads', 'rules.sqlite3'))
+
+def rules_db(db_path):
+    """Open the saved rule set database at db_path, creating its table on first use."""
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS rule_sets ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, version INTEGER NOT NULL, '
+        'created REAL NOT NULL, rules TEXT NOT NULL, UNIQUE (name, version))'
+    )
+    return conn
+
+def save_rule_set(db_path, name, rules):
+    """Store already-validated rules as the next version of a named rule set. Returns (id, version)."""
+    with closing(rules_db(db_path)) as conn, conn:
+        # BEGIN IMMEDIATE serializes concurrent saves, so each gets its own version number
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('SELECT COALESCE(MAX(version), 0) + 1 FROM rule_sets WHERE name = ?', (name,)).fetchone()[0]
+        cursor = conn.execute('INSERT INTO rule_sets (name, version, created, rules) VALUES (?, ?, ?, ?)',
+                              (name, version, time.time(), json.dumps(rules)))
+    logger.debug(f"Saved rule set {name} v{version}")
+    return cursor.lastrowid, version
+
+def list_rule_sets(db_path):
+    """Return every saved rule set version (id, name, version, created), newest first within each name."""
+    with closing(rules_db(db_path)) as conn:
+        rows = conn.execute('SELECT id, name, version, created FROM rule_sets ORDER BY name, version DESC').fetchall()
+    return [dict(row) for row in rows]
+
+def load_rule_set(db_path, rule_set_id):
+    """Return a saved rule set version with its parsed rules, or None if it does not exist."""
+    with closing(rules_db(db_path)) as conn:
+        row = conn.execute('SELECT id, name, version, created, rules FROM rule_sets WHERE id = ?', (rule_set_id,)).fetchone()
+    if row is None:
+        return None
+    saved = dict(row)
+    saved['rules'] = json.loads(saved['rules'])
+    return saved
+
+@functools.lru_cache(maxsize=32)
+def compiled_rule_set(db_path, rule_set_id):
+    """Compile a saved rule set version once; versions never change, so the RuleSet can be reused."""
+    saved = load_rule_set(db_path, rule_set_id)
+    return None if saved is None else compile_pricing_rules(saved['rules'])
+
+def resolve_rules(db_path, saved_rules_id=None, pricing_lines=None, form=None):
+    """Pricing rules from a saved rule set ID, pricing file lines or pricing form fields, in that order.
+
+    Returns (rules, non_zero_prices), or None when the saved rule set does not exist.
+    """
+    if saved_rules_id:
+        saved = load_rule_set(db_path, saved_rules_id)
+        return None if saved is None else (saved['rules'], True)
+    if pricing_lines is not None:
+        form = parse_pricing_file(pricing_lines)
+    return parse_pricing_rules(form or {})
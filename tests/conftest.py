@@ -0,0 +1,23 @@
+"""Shared test setup: import the engine from this checkout, load the sample pricing rules and vary their costs."""
+import os
+import sys
+
+import pytest
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+from pricingdeconstructor.engine import parse_pricing_file, parse_pricing_rules
+
+
+@pytest.fixture
+def sample_rules():
+    """Nested Process/Coating rules from attributePricing.txt, as the app builds them (float costs)."""
+    with open(os.path.join(repo_root, 'attributePricing.txt'), encoding='utf-8-sig') as f:
+        rules, _ = parse_pricing_rules(parse_pricing_file(f.read().splitlines()))
+    return rules
+
+
+def whole_cost_rules(rules, **coating_costs):
+    """The same rules with int costs, as a blank form field leaves them, and optional coating overrides."""
+    return {'Process': {process: {step: int(cost) for step, cost in steps.items()} for process, steps in rules['Process'].items()},
+            'Coating': {**{coating: int(cost) for coating, cost in rules['Coating'].items()}, **coating_costs}}
@@ -0,0 +1,14 @@
+"""Batch summaries name each report by the file the user uploaded, not the copy saved for the workers."""
+import pandas as pd
+
+from pricingdeconstructor.engine import run_batch
+
+
+def test_batch_messages_use_upload_names(tmp_path, sample_rules):
+    stored = tmp_path / '20250131_120000_batch0_sales.csv'
+    pd.DataFrame({'Sales Price': [520.0], 'Process': ['Chemetch']}).to_csv(stored, index=False)
+    summaries, combined_df = run_batch([str(stored)], sample_rules, [str(tmp_path / 'results.parquet')], names=['sales.csv'])
+    assert combined_df is None
+    assert summaries[0]['file'] == 'sales.csv'
+    assert 'sales.csv' in summaries[0]['error']
+    assert stored.name not in summaries[0]['error']
@@ -0,0 +1,162 @@
+"""The column-wise engine against the per-row loop it replaced, on rows covering every branch of that loop."""
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pricingdeconstructor.engine import (
+    compile_pricing_rules, deconstruct_sales_data, result_columns, resolve_sales_columns, sales_read_dtypes
+)
+
+from conftest import whole_cost_rules
+
+
+def reference_deconstruct(df, pricing_rules):
+    """The iterrows loop pricing_form ran before the engine, with its logging left out."""
+    results = []
+    skipped_rows = []
+    for index, row in df.iterrows():
+        try:
+            # Check for missing required fields
+            missing_fields = []
+            if pd.isna(row['Sales Price']):
+                missing_fields.append('Sales Price')
+            if pd.isna(row['Frame']):
+                missing_fields.append('Frame')
+            if pd.isna(row['Customer/Project: Company Name']):
+                missing_fields.append('Customer/Project: Company Name')
+            if missing_fields:
+                skipped_rows.append((index, f"Missing required fields: {', '.join(missing_fields)}"))
+                continue
+
+            process = str(row['Process']).strip() if not pd.isna(row['Process']) else 'Unknown'
+            step_process = str(row['[ES] Step Process']).strip() if not pd.isna(row['[ES] Step Process']) else 'None'
+            if process == 'LaserSTEP':
+                step_process = re.sub(r'\s*-\s*', '-', step_process)
+            coating = str(row['Coating']).strip() if not pd.isna(row['Coating']) else 'None'
+            foil_material = str(row['Foil Material']).strip() if not pd.isna(row['Foil Material']) else 'Unknown'
+            foil_thickness = str(row['Foil Thickness']).strip() if not pd.isna(row['Foil Thickness']) else 'Unknown'
+            colour = str(row['Colour']).strip() if not pd.isna(row['Colour']) else 'Unknown'
+            customer = str(row['Customer/Project: Company Name']).strip() if not pd.isna(row['Customer/Project: Company Name']) else 'Unknown'
+            customer_internal_id = str(row.get('Customer/Project: Internal ID', 'Unknown')).strip()
+            item_internal_id = str(row.get('Item: Internal ID', 'Unknown')).strip()
+
+            try:
+                sales_price = float(row['Sales Price'])
+            except (ValueError, TypeError):
+                skipped_rows.append((index, f"Invalid Sales Price: {row['Sales Price']}"))
+                continue
+
+            attribute_cost = 0
+            if process != 'LaserCut':
+                if process in pricing_rules["Process"]:
+                    if step_process in pricing_rules["Process"][process]:
+                        attribute_cost += pricing_rules["Process"][process][step_process]
+                if coating in pricing_rules["Coating"]:
+                    attribute_cost += pricing_rules["Coating"][coating]
+
+            base_cost = sales_price - attribute_cost
+
+            results.append({
+                'Customer': customer,
+                'Customer_Internal_ID': customer_internal_id,
+                'Frame': str(row['Frame']).strip(),
+                'Item_Internal_ID': item_internal_id,
+                'Sales_Price': sales_price,
+                'Process': process,
+                'Step_Process': step_process,
+                'Coating': coating,
+                'Foil_Material': foil_material,
+                'Foil_Thickness': foil_thickness,
+                'Colour': colour,
+                'Attribute_Cost': attribute_cost,
+                'Base_Cost': base_cost
+            })
+        except Exception as e:
+            skipped_rows.append((index, f"Error processing row: {str(e)}"))
+            continue
+    return results, skipped_rows
+
+
+# Every LaserSTEP step here either names a tier exactly or matches no tier at all, so
+# the steps the engine resolves by count since the tier change (e.g. "41-46") are
+# tested on their own and the loop's exact-name lookup stays the reference.
+sales_rows = [
+    # Sales Price, Frame, Company Name, Process, Step Process, Coating, Foil Material, Foil Thickness, Colour, Customer ID, Item ID
+    (500, '29 x 29 SpaceSaver', 'Acme', 'Chemetch', 'Single', 'Advanced Nano', 'PHD', 4.0, 'Silver', 40001, 7001),
+    (None, '29 x 29 SpaceSaver', 'Acme', 'Chemetch', 'Single', 'Nano Wipe', 'PHD', 4.0, 'Silver', 40001, 7001),
+    (320, None, None, 'Lasercut', None, None, 'FG', 5.0, 'Blue', 40002, 7002),
+    (None, None, 'Beta Corp', 'LaserSTEP', '1-2', None, 'PHD', 4.0, 'Blue', 40003, 7003),
+    ('abc', '23 x 23 QTS Foil', 'Beta Corp', 'Chemetch', 'Double', 'Nano Slic', 'EF', 3.0, 'Green', 40003, 7004),
+    ('', 'Frameless', 'Beta Corp', 'Milled', 'Quad', None, 'PHD', 4.0, 'White', 40003, 7005),
+    ('410.5', '  23 x 23 QTS Foil ', '  Gamma Ltd ', ' LaserSTEP ', '1 - 5', ' Nano Wipe', 'PHD', 4.0, 'Silver', 40004, 7004),
+    (725, '29 x 29 Standard Tube', 'Gamma Ltd', 'LaserSTEP', '21 -30', 'Advanced Nano', 'FG', 6.0, 'Blue', 40004, 7006),
+    (610, '29 x 29 Standard Tube', 'Gamma Ltd', 'LaserSTEP', ' 1-10 ', None, 'FG', 6.0, 'Blue', 40004, 7006),
+    (880, '29 x 29 Standard Tube', 'Gamma Ltd', 'LaserSTEP', '61 - 84', 'Nano Wipe', 'FG', 6.0, 'Blue', 40004, 7006),
+    (880, '29 x 29 Standard Tube', 'Gamma Ltd', 'LaserSTEP', 'Custom', 'Nano Wipe', 'FG', 6.0, 'Blue', 40004, 7006),
+    (225, '29 x 29 SpaceSaver', 'Delta Inc', 'LaserCut', None, 'Advanced Nano', 'PHD', 4.0, 'Silver', 40005, 7001),
+    (225, '29 x 29 SpaceSaver', 'Delta Inc', 'Lasercut', None, 'Advanced Nano', 'PHD', 4.0, 'Silver', 40005, 7001),
+    (875, 'MiniStencil', 'Delta Inc', 'AMTX Electroform', 'Single', 'Nano Wipe', 'PHD', 4.0, 'Silver', 40005, 7007),
+    (640, 'MiniStencil', 'Delta Inc', 'Chemetch', 'Quintuple', 'Nano Wipe', 'PHD', 4.0, 'Silver', 40005, 7007),
+    (640, 'MiniStencil', 'Delta Inc', 'Chemetch', 'Triple', 'Gold Flash', 'PHD', 4.0, 'Silver', 40005, 7007),
+    (210, 'Other', 'Epsilon', None, None, None, None, None, None, None, None),
+    (-105, 'Other', 'Epsilon', 'Milled', 'Single', 'BluPrint', None, 3.5, None, 40006, None),
+    (0, 'Other', 'Epsilon', 'Chemetch', '5 or more', 'Nano Slic', 'Nicut/SNL', 1.5, 'Not Applicable', 40006, 7008),
+]
+sales_header = ['Sales Price', 'Frame', 'Customer/Project: Company Name', 'Process', '[ES] Step Process', 'Coating',
+                'Foil Material', 'Foil Thickness', 'Colour', 'Customer/Project: Internal ID', 'Item: Internal ID']
+
+
+def sales_frame(read_dtypes=False):
+    """The fixture rows as pd.read_excel returns them, or with the engine's read dtypes (categoricals)."""
+    df = pd.DataFrame(sales_rows, columns=sales_header).fillna(np.nan)
+    if read_dtypes:
+        df = df.astype(sales_read_dtypes(resolve_sales_columns(df.columns)))
+    return df
+
+
+def engine_results(df, rules):
+    """Run the engine and put its output in the loop's shape: plain object columns, no cost components."""
+    result_df, skipped_rows = deconstruct_sales_data(df, compile_pricing_rules(rules))
+    result_df = result_df[result_columns]
+    return result_df.astype({col: object for col in result_df.columns if isinstance(result_df[col].dtype, pd.CategoricalDtype)}), skipped_rows
+
+
+@pytest.mark.parametrize('read_dtypes', [False, True], ids=['plain', 'read-dtypes'])
+@pytest.mark.parametrize('costs', ['float', 'int', 'mixed'])
+def test_engine_matches_loop(sample_rules, read_dtypes, costs):
+    # Attribute_Cost stays int64 only while no row picks up a float cost
+    rules = {'float': sample_rules, 'int': whole_cost_rules(sample_rules),
+             'mixed': whole_cost_rules(sample_rules, **{'Nano Wipe': 40.5})}[costs]
+    df = sales_frame(read_dtypes)
+    results, skipped_rows = reference_deconstruct(sales_frame(), rules)
+    result_df, engine_skipped = engine_results(df, rules)
+    assert engine_skipped == skipped_rows
+    pd.testing.assert_frame_equal(result_df, pd.DataFrame(results), check_exact=True)
+
+
+def test_engine_matches_loop_without_optional_columns(sample_rules):
+    df = sales_frame().drop(columns=['Customer/Project: Internal ID', 'Item: Internal ID'])
+    results, skipped_rows = reference_deconstruct(df, sample_rules)
+    result_df, engine_skipped = engine_results(df, sample_rules)
+    assert engine_skipped == skipped_rows
+    pd.testing.assert_frame_equal(result_df, pd.DataFrame(results), check_exact=True)
+
+
+@pytest.mark.parametrize('column', ['Frame', 'Colour'])
+def test_engine_matches_loop_with_absent_column(sample_rules, column):
+    # A row reaching an absent column fails with the KeyError the loop reported
+    df = sales_frame().drop(columns=[column])
+    results, skipped_rows = reference_deconstruct(df, sample_rules)
+    result_df, engine_skipped = deconstruct_sales_data(df, compile_pricing_rules(sample_rules))
+    assert results == [] and result_df.empty
+    assert engine_skipped == skipped_rows
+
+
+def test_engine_matches_loop_when_every_row_is_skipped(sample_rules):
+    df = sales_frame().assign(**{'Sales Price': 'n/a'})
+    results, skipped_rows = reference_deconstruct(df, sample_rules)
+    result_df, engine_skipped = deconstruct_sales_data(df, compile_pricing_rules(sample_rules))
+    assert results == [] and result_df.empty
+    assert engine_skipped == skipped_rows
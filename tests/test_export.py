@@ -0,0 +1,44 @@
+"""Downloads are generated from a job's stored results on first request."""
+import importlib
+import os
+
+import pandas as pd
+import pytest
+
+from pricingdeconstructor.engine import compile_pricing_rules, cost_component_columns, deconstruct_sales_data
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The web app module, with its Uploads folders in a scratch directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('LOG_LEVEL', 'WARNING')
+    app = importlib.import_module('app')
+    for folder in (app.RESULTS_FOLDER, app.METRICS_FOLDER):
+        os.makedirs(folder, exist_ok=True)  # The app creates them on import, in whichever directory that was
+    return app
+
+
+@pytest.fixture
+def result_df(sample_rules):
+    """A few priced rows, well under FAST_XLSX_MIN_ROWS, with the stored cost components."""
+    df = pd.DataFrame({
+        'Sales Price': [520.0, 450.5, 225.0], 'Frame': '29 x 29 SpaceSaver', 'Customer/Project: Company Name': ['Acme', 'Acme', 'Beta'],
+        'Process': ['Chemetch', 'LaserSTEP', 'LaserCut'], '[ES] Step Process': ['Single', '1-5', None],
+        'Coating': ['Advanced Nano', 'Nano Wipe', None], 'Foil Material': 'PHD', 'Foil Thickness': 4.0, 'Colour': 'Silver',
+    })
+    return deconstruct_sales_data(df, compile_pricing_rules(sample_rules))[0]
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'xlsx'])
+def test_export_small_results(app, result_df, fmt):
+    job_id = app.create_result_job()
+    result_df.to_parquet(app.result_artifact_path(job_id, 'results.parquet'), index=False)
+    export_path = app.export_results(job_id, fmt)
+    assert export_path == app.result_artifact_path(job_id, f'results.{fmt}')
+    exported = pd.read_csv(export_path) if fmt == 'csv' else pd.read_excel(export_path)
+    expected = result_df.drop(columns=cost_component_columns)
+    assert exported.columns.tolist() == expected.columns.tolist()
+    assert exported['Base_Cost'].tolist() == expected['Base_Cost'].tolist()
+    assert sorted(os.listdir(os.path.dirname(export_path))) == sorted(['results.parquet', f'results.{fmt}'])
+    assert app.export_results(job_id, fmt) == export_path  # Later downloads reuse the file
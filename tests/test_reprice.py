@@ -0,0 +1,91 @@
+"""Re-pricing stored results in place gives exactly what pricing from scratch with the new rules gives."""
+import copy
+
+import pandas as pd
+import pytest
+
+from pricingdeconstructor.engine import (
+    RowDeduplicator, apply_pricing_rules, compile_pricing_rules, deduplicate_results, normalize_sales_data, reprice_results
+)
+
+from conftest import whole_cost_rules
+
+# Process, Step Process, Coating, Sales Price; repeated rows are removed by deduplication
+sales_lines = [
+    ('Chemetch', 'Single', 'Advanced Nano', 520), ('Chemetch', 'Single', 'Advanced Nano', 520),
+    ('Chemetch', 'Double', 'Nano Slic', 610), ('Chemetch', 'Single', None, 400),
+    ('LaserSTEP', '1 - 5', 'Nano Wipe', 450), ('LaserSTEP', '1-5', 'Nano Wipe', 450), ('LaserSTEP', '3', 'Nano Slic', 380),
+    ('LaserSTEP', '47-60', 'Advanced Nano', 905.5), ('LaserSTEP', '61-84', 'Nano Wipe', 990),
+    ('Milled', 'Quad', 'BluPrint', 2400), ('Milled', 'Single', 'Gold Flash', 700),
+    ('LaserCut', None, 'Advanced Nano', 225), ('Lasercut', None, 'Nano Slic', 260), ('Lasercut', None, None, 210),
+    ('Lasercut', None, None, 210), ('AMTX Electroform', 'Single', 'Nano Wipe', 875), (None, None, None, 190),
+]
+
+
+@pytest.fixture
+def sales_df():
+    """The sales lines, normalized as the engine reads them."""
+    df = pd.DataFrame({
+        'Sales Price': [price for *_, price in sales_lines],
+        'Frame': '29 x 29 SpaceSaver',
+        'Customer/Project: Company Name': [f'Customer {i % 4}' for i in range(len(sales_lines))],
+        'Process': [process for process, *_ in sales_lines],
+        '[ES] Step Process': [step for _, step, *_ in sales_lines],
+        'Coating': [coating for _, _, coating, _ in sales_lines],
+        'Foil Material': 'PHD', 'Foil Thickness': 4.0, 'Colour': 'Silver',
+    })
+    return normalize_sales_data(df)[0]
+
+
+def change_rules(rules, change):
+    """Return a copy of rules with one of the changes users make on the pricing form."""
+    rules = copy.deepcopy(rules)
+    if change == 'coating price':
+        rules['Coating']['Nano Slic'] = 50.0
+    elif change == 'laserstep tier':
+        rules['Process']['LaserSTEP']['1-5'] = 130.0
+    elif change == 'int to float':
+        rules['Process']['Chemetch']['Single'] = float(rules['Process']['Chemetch']['Single'])
+    elif change == 'float to int':
+        rules['Process']['Chemetch']['Single'] = int(rules['Process']['Chemetch']['Single'])
+    elif change == 'coating cleared':
+        rules['Coating']['Advanced Nano'] = 0  # A blank form field
+    elif change == 'coating removed':
+        del rules['Coating']['BluPrint']
+    elif change == 'coating added':
+        rules['Coating']['Gold Flash'] = 75.0
+    elif change == 'several':
+        rules['Coating']['Nano Wipe'] = 45.5
+        rules['Process']['LaserSTEP']['51-60'] = 600.0
+        rules['Process']['Milled']['Quad'] = 0
+    return rules
+
+
+rule_changes = [
+    ('coating price', 'float'), ('laserstep tier', 'float'), ('int to float', 'int'), ('float to int', 'float'),
+    ('coating cleared', 'float'), ('coating cleared', 'int'), ('coating removed', 'float'), ('coating added', 'int'),
+    ('several', 'float'), ('unchanged', 'float'),
+]
+
+
+@pytest.mark.parametrize('change, costs', rule_changes)
+def test_reprice_matches_fresh_pricing(sales_df, sample_rules, change, costs):
+    old_rules = sample_rules if costs == 'float' else whole_cost_rules(sample_rules)
+    old, new = compile_pricing_rules(old_rules), compile_pricing_rules(change_rules(old_rules, change))
+    repriced, changed = reprice_results(apply_pricing_rules(sales_df, old), old, new)
+    fresh = apply_pricing_rules(sales_df, new)
+    pd.testing.assert_frame_equal(repriced, fresh, check_exact=True)
+    # changed marks exactly the rows whose costs moved
+    before = apply_pricing_rules(sales_df, old)
+    assert changed.tolist() == (before['Attribute_Cost'] != fresh['Attribute_Cost']).tolist()
+
+
+@pytest.mark.parametrize('change, costs', rule_changes)
+def test_reprice_of_stored_results_matches_fresh_run(tmp_path, sales_df, sample_rules, change, costs):
+    # As the app does it: deduplicated results round-trip through Parquet, then are re-priced
+    old_rules = sample_rules if costs == 'float' else whole_cost_rules(sample_rules)
+    old, new = compile_pricing_rules(old_rules), compile_pricing_rules(change_rules(old_rules, change))
+    deduplicate_results(apply_pricing_rules(sales_df, old), RowDeduplicator(), 'report').to_parquet(tmp_path / 'results.parquet')
+    repriced, _ = reprice_results(pd.read_parquet(tmp_path / 'results.parquet'), old, new)
+    fresh = deduplicate_results(apply_pricing_rules(sales_df, new), RowDeduplicator(), 'report')
+    pd.testing.assert_frame_equal(repriced, fresh, check_exact=True)
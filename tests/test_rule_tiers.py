@@ -0,0 +1,81 @@
+"""LaserSTEP step counts and ranges resolve to the tier covering their upper count, or stay unpriced."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pricingdeconstructor.engine import compile_pricing_rules, deconstruct_sales_data
+
+
+def step_costs(rule_set, process, steps):
+    """Look up steps of one process, returning each cost or None where no rule matched."""
+    costs, found, _ = rule_set.process_cost_table(np.array([process] * len(steps), dtype=object), np.array(steps, dtype=object))
+    return [cost if matched else None for cost, matched in zip(costs.tolist(), found)]
+
+
+@pytest.mark.parametrize('step, tier', [
+    ('1-5', '1-5'),  # Named tiers match by name
+    ('51-60', '51-60'),
+    ('1', '1-2'),  # A count goes to the first tier whose upper bound covers it
+    ('2', '1-2'),
+    ('3', '1-5'),
+    ('7', '1-10'),
+    ('25', '21-30'),
+    ('60', '51-60'),
+    (' 25 ', '21-30'),
+    ('47-60', '51-60'),  # A range crossing tiers goes by its upper count
+    ('41-46', '41-50'),
+    ('18-25', '21-30'),
+    ('3-4', '1-5'),  # Ranges inside the overlapping low tiers
+    ('1-4', '1-5'),
+    ('11-15', '1-15'),
+    ('16 - 20', '1-20'),
+])
+def test_step_resolves_to_tier(sample_rules, step, tier):
+    rule_set = compile_pricing_rules(sample_rules)
+    assert step_costs(rule_set, 'LaserSTEP', [step]) == [sample_rules['Process']['LaserSTEP'][tier]]
+
+
+@pytest.mark.parametrize('step', [
+    '61-84', '85-100', '61', '1-100',  # Above the last tier
+    '0', '0-2',  # Below the first tier
+    '30-21',  # Reversed range
+    'Custom', 'None', '', '1-2 mm', '1-', '-5', '2.5', 'nan',  # Not a count or range
+])
+def test_step_outside_tiers_stays_unpriced(sample_rules, step):
+    rule_set = compile_pricing_rules(sample_rules)
+    assert step_costs(rule_set, 'LaserSTEP', [step]) == [None]
+
+
+def test_count_in_gap_between_tiers_stays_unpriced():
+    rule_set = compile_pricing_rules({'Process': {'LaserSTEP': {'1-10': 100, '21-30': 200}}, 'Coating': {}})
+    assert step_costs(rule_set, 'LaserSTEP', ['5', '15', '11-20', '15-25', '25']) == [100, None, None, 200, 200]
+
+
+def test_processes_with_named_steps_are_not_tiered(sample_rules):
+    rule_set = compile_pricing_rules(sample_rules)
+    assert step_costs(rule_set, 'Chemetch', ['Single', '1', '2']) == [sample_rules['Process']['Chemetch']['Single'], None, None]
+    assert step_costs(rule_set, 'Lasercut', ['25']) == [None]
+
+
+def test_whole_column_resolves_in_one_pass(sample_rules):
+    # Tiered, named and unpriced steps mixed in one column keep their own results
+    rule_set = compile_pricing_rules(sample_rules)
+    steps = ['25', 'Custom', '1-5', '47-60', '61-84', '3-4', '0', '25']
+    tiers = sample_rules['Process']['LaserSTEP']
+    assert step_costs(rule_set, 'LaserSTEP', steps) == [
+        tiers['21-30'], None, tiers['1-5'], tiers['51-60'], None, tiers['1-5'], None, tiers['21-30']
+    ]
+
+
+def test_report_steps_price_at_their_tier(sample_rules):
+    # Report steps are spaced ("47 - 60") and normalized before the lookup
+    df = pd.DataFrame({
+        'Sales Price': [900.0, 640.0, 880.0], 'Frame': 'Frameless', 'Customer/Project: Company Name': 'Acme',
+        'Process': 'LaserSTEP', '[ES] Step Process': ['47 - 60', '25', '61 - 84'], 'Coating': 'Nano Wipe',
+        'Foil Material': 'PHD', 'Foil Thickness': 4.0, 'Colour': 'Silver',
+    })
+    result_df, _ = deconstruct_sales_data(df, compile_pricing_rules(sample_rules))
+    tiers, coating = sample_rules['Process']['LaserSTEP'], sample_rules['Coating']['Nano Wipe']
+    assert result_df['Step_Process'].tolist() == ['47-60', '25', '61-84']
+    assert result_df['Attribute_Cost'].tolist() == [tiers['51-60'] + coating, tiers['21-30'] + coating, coating]
+    assert result_df['Base_Cost'].tolist() == [900.0 - tiers['51-60'] - coating, 640.0 - tiers['21-30'] - coating, 880.0 - coating]
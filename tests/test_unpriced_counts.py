@@ -0,0 +1,80 @@
+"""Per-run unpriced-row warnings count report rows, however the report was read."""
+import logging
+
+import pandas as pd
+import pytest
+
+from pricingdeconstructor import engine
+from pricingdeconstructor.engine import RowDeduplicator, compile_pricing_rules, parse_sales_report, price_sales_data
+
+# (Process, Step Process, Coating, Sales Price) -> times the row repeats in the report
+report_lines = {
+    ('Lasercut', None, None, 225): 7,
+    ('Lasercut', None, 'Nano Wipe', 265): 3,
+    ('Chemetch', 'Single', 'Gold Flash', 500): 4,
+    ('AMTX Electroform', 'Single', None, 875): 2,
+    ('LaserSTEP', '61-84', 'Advanced Nano', 900): 1,
+    ('LaserCut', None, None, 210): 5,
+}
+
+
+@pytest.fixture
+def report():
+    """The report lines, repeated and interleaved, as a DataFrame."""
+    rows = [line for line, repeats in report_lines.items() for _ in range(repeats)]
+    rows = rows[::2] + rows[1::2]
+    return pd.DataFrame({
+        'Date': '2025-01-31',
+        'Sales Price': [price for *_, price in rows],
+        'Frame': '29 x 29 SpaceSaver',
+        'Customer/Project: Company Name': 'Acme',
+        'Process': [process for process, *_ in rows],
+        '[ES] Step Process': [step for _, step, *_ in rows],
+        'Coating': [coating for _, _, coating, _ in rows],
+        'Foil Material': 'PHD',
+        'Foil Thickness': 4.0,
+        'Colour': 'Silver',
+        'Customer/Project: Internal ID': 40001,
+        'Item: Internal ID': 7001,
+    })
+
+
+def unpriced_warnings(caplog, sales_df, skipped_rows, rules, deduplicator):
+    """Price parsed rows and return the unpriced-row warnings logged."""
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger=engine.logger.name):
+        price_sales_data(sales_df, skipped_rows, compile_pricing_rules(rules), 'report', deduplicator)
+    return [record.getMessage() for record in caplog.records if ' rows with ' in record.getMessage()]
+
+
+def test_streamed_and_whole_reads_report_the_same_counts(tmp_path, report, sample_rules, caplog, monkeypatch):
+    # CSV reports are deduplicated batch by batch as they stream in; Parquet reports are read whole
+    monkeypatch.setitem(engine.config, 'CSV_CHUNK_ROWS', 5)
+    report.to_csv(tmp_path / 'report.csv', index=False)
+    report.to_parquet(tmp_path / 'report.parquet', index=False)
+    warnings = {}
+    for fmt in ['csv', 'parquet']:
+        deduplicator = RowDeduplicator()
+        sales_df, skipped_rows, _ = parse_sales_report(str(tmp_path / f'report.{fmt}'), deduplicator)
+        warnings[fmt] = unpriced_warnings(caplog, sales_df, skipped_rows, sample_rules, deduplicator)
+    assert warnings['csv'] == warnings['parquet']
+    assert warnings['csv'] == [
+        f"10 of {len(report)} rows with unknown process 'Lasercut'",
+        f"9 of {len(report)} rows with unknown coating 'None'",
+        f"4 of {len(report)} rows with unknown coating 'Gold Flash'",
+        f"2 of {len(report)} rows with unknown process 'AMTX Electroform'",
+        f"1 of {len(report)} rows with unknown step '61-84' for process 'LaserSTEP'",
+    ]
+
+
+def test_restored_deduplicator_reports_the_same_counts(tmp_path, report, sample_rules, caplog, monkeypatch):
+    # A cached parse keeps only the first row of each combination, with counts_for and rows_seen beside it
+    monkeypatch.setitem(engine.config, 'CSV_CHUNK_ROWS', 5)
+    report.to_csv(tmp_path / 'report.csv', index=False)
+    deduplicator = RowDeduplicator()
+    sales_df, skipped_rows, _ = parse_sales_report(str(tmp_path / 'report.csv'), deduplicator)
+    parsed = unpriced_warnings(caplog, sales_df, skipped_rows, sample_rules, deduplicator)
+    restored = RowDeduplicator()
+    restored.restore(sales_df, deduplicator.counts_for(sales_df), deduplicator.rows_seen)
+    assert unpriced_warnings(caplog, sales_df, skipped_rows, sample_rules, restored) == parsed
+    assert restored.duplicates == deduplicator.duplicates == len(report) - len(report_lines)